@@ -0,0 +1,260 @@
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from .archive import MAX_ARCHIVE_BYTES
+from .auth import get_current_user
+from .resilience import without_deadline
+
+MAX_CONCURRENT_JOBS = int(os.getenv("HEDA_MAX_CONCURRENT_JOBS", "8"))
+MAX_CONCURRENT_JOBS_PER_USER = int(os.getenv("HEDA_MAX_CONCURRENT_JOBS_PER_USER", "2"))
+MAX_QUEUED_JOBS = int(os.getenv("HEDA_MAX_QUEUED_JOBS", "100"))
+MAX_QUEUED_JOBS_PER_USER = int(os.getenv("HEDA_MAX_QUEUED_JOBS_PER_USER", "10"))
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("HEDA_MAX_QUEUE_WAIT_SECONDS", "30"))
+TEMP_DISK_BUDGET_BYTES = int(os.getenv("HEDA_TEMP_DISK_BUDGET_BYTES", str(20 * 1024 ** 3)))
+# Clone and work tree overhead charged to every job on top of its upload
+JOB_BASE_BYTES = int(os.getenv("HEDA_JOB_BASE_BYTES", str(50 * 1024 ** 2)))
+
+# (method, path) of routes that clone a repo and stage files on disk
+HEAVY_ROUTES = {
+    ("POST", "/init"),
+    ("POST", "/publish"),
+    ("POST", "/publish/archive"),
+    ("POST", "/publish/manifest"),
+    ("POST", "/publish/delta"),
+}
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    """
+    Parse HEDA_USER_WEIGHTS, e.g. "alice=2,bob=0.5".
+    """
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        user, _, weight = item.partition("=")
+        weights[user.strip()] = float(weight)
+    return weights
+
+
+USER_WEIGHTS = _parse_weights(os.getenv("HEDA_USER_WEIGHTS", ""))
+
+
+@dataclass
+class _Ticket:
+    user: str
+    nbytes: int
+    start_tag: float
+    finish_tag: float
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    admitted: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class AdmissionController:
+    """
+    Admission control for heavy routes (clone + temp dir per request).
+
+    Jobs are admitted while global and per-user concurrency caps allow it;
+    otherwise they wait in per-user queues served by weighted fair queuing
+    (start-time fair queuing over unit job cost), so a bulk uploader only
+    delays itself. Requests that would exceed the temp-disk budget or the
+    queue limits are rejected immediately with 429 and a Retry-After hint.
+    All state is touched from the event loop only.
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, Deque[_Ticket]] = defaultdict(deque)
+        self._running = 0
+        self._running_per_user: Dict[str, int] = defaultdict(int)
+        self._disk_reserved = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._avg_wait = 0.0
+        self._max_wait = 0.0
+        self._avg_job = 1.0
+        self._admitted = 0
+        self._rejected = 0
+
+    def _queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _retry_after(self) -> int:
+        backlog = self._queued() + self._running + 1
+        return max(1, math.ceil(self._avg_job * backlog / MAX_CONCURRENT_JOBS))
+
+    def _reject(self, detail: str):
+        self._rejected += 1
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    def _dispatch(self) -> None:
+        while self._running < MAX_CONCURRENT_JOBS:
+            eligible = [
+                queue[0] for user, queue in self._queues.items()
+                if queue and self._running_per_user[user] < MAX_CONCURRENT_JOBS_PER_USER
+            ]
+            if not eligible:
+                return
+
+            ticket = min(eligible, key=lambda t: t.finish_tag)
+            self._queues[ticket.user].popleft()
+            if not self._queues[ticket.user]:
+                del self._queues[ticket.user]
+
+            self._virtual_time = ticket.finish_tag
+            self._running += 1
+            self._running_per_user[ticket.user] += 1
+            ticket.started_at = time.monotonic()
+
+            wait = ticket.started_at - ticket.enqueued_at
+            self._avg_wait = 0.9 * self._avg_wait + 0.1 * wait
+            self._max_wait = max(self._max_wait, wait)
+            self._admitted += 1
+            ticket.admitted.set_result(None)
+
+    def _withdraw(self, ticket: _Ticket) -> None:
+        queue = self._queues.get(ticket.user)
+        if queue and ticket in queue:
+            index = queue.index(ticket)
+            del queue[index]
+
+            # Hand the withdrawn slot back: the user's later tickets move up
+            # into it instead of staying tagged behind a job that never ran
+            finish = ticket.start_tag
+            for later in list(queue)[index:]:
+                start = min(later.start_tag, max(finish, self._virtual_time))
+                finish = start + (later.finish_tag - later.start_tag)
+                later.start_tag, later.finish_tag = start, finish
+            self._last_finish[ticket.user] = finish
+
+            if not queue:
+                del self._queues[ticket.user]
+        self._disk_reserved -= ticket.nbytes
+
+    async def acquire(self, user: str, nbytes: int) -> _Ticket:
+        nbytes += JOB_BASE_BYTES
+
+        if nbytes > TEMP_DISK_BUDGET_BYTES:
+            raise HTTPException(status_code=413, detail="Upload exceeds the temporary disk budget")
+        if self._disk_reserved + nbytes > TEMP_DISK_BUDGET_BYTES:
+            self._reject("Temporary disk budget exhausted, retry later")
+        if self._queued() >= MAX_QUEUED_JOBS:
+            self._reject("Server busy, retry later")
+        if len(self._queues.get(user, ())) >= MAX_QUEUED_JOBS_PER_USER:
+            self._reject("Too many queued requests for this user")
+
+        weight = USER_WEIGHTS.get(user, 1.0)
+        start_tag = max(self._virtual_time, self._last_finish.get(user, 0.0))
+        ticket = _Ticket(user=user, nbytes=nbytes, start_tag=start_tag, finish_tag=start_tag + 1.0 / weight)
+        self._last_finish[user] = ticket.finish_tag
+
+        self._disk_reserved += nbytes
+        self._queues[user].append(ticket)
+        self._dispatch()
+
+        if ticket.admitted.done():
+            return ticket
+
+        try:
+            await asyncio.wait({ticket.admitted}, timeout=MAX_QUEUE_WAIT_SECONDS)
+        except BaseException:
+            # Client went away while queued
+            if ticket.admitted.done():
+                self.release(ticket)
+            else:
+                self._withdraw(ticket)
+            raise
+
+        if not ticket.admitted.done():
+            self._withdraw(ticket)
+            self._reject("Timed out waiting for a free slot")
+
+        return ticket
+
+    def release(self, ticket: _Ticket) -> None:
+        self._running -= 1
+        self._running_per_user[ticket.user] -= 1
+        if not self._running_per_user[ticket.user]:
+            del self._running_per_user[ticket.user]
+        self._disk_reserved -= ticket.nbytes
+
+        self._avg_job = 0.9 * self._avg_job + 0.1 * (time.monotonic() - ticket.started_at)
+        self._dispatch()
+
+    def stats(self, user: str) -> Dict:
+        """
+        Aggregate figures plus the entries of `user`; other users' jobs are
+        only counted.
+        """
+        now = time.monotonic()
+        return {
+            "running": self._running,
+            "queued": self._queued(),
+            "users_running": len(self._running_per_user),
+            "users_queued": len(self._queues),
+            "my_running": self._running_per_user.get(user, 0),
+            "my_queued": len(self._queues.get(user, ())),
+            "oldest_wait_seconds": max(
+                (now - q[0].enqueued_at for q in self._queues.values() if q),
+                default=0.0,
+            ),
+            "avg_wait_seconds": self._avg_wait,
+            "max_wait_seconds": self._max_wait,
+            "avg_job_seconds": self._avg_job,
+            "disk_reserved_bytes": self._disk_reserved,
+            "disk_budget_bytes": TEMP_DISK_BUDGET_BYTES,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+        }
+
+
+admission_controller = AdmissionController()
+
+
+async def admission_middleware(request: Request, call_next):
+    """
+    Hold an admission slot for the duration of a heavy request. Runs before
+    the route reads the body, so rejected uploads are never spooled to disk.
+    Heavy routes push branches and change repo settings partway through, so
+    they run without the client's deadline rather than stop half done.
+    """
+    if (request.method, request.url.path) not in HEAVY_ROUTES:
+        return await call_next(request)
+
+    try:
+        length = request.headers.get("content-length")
+        if length is not None:
+            try:
+                nbytes = int(length)
+                if nbytes < 0:
+                    raise ValueError(length)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        elif "transfer-encoding" in request.headers:
+            # Streamed body of unknown size: reserve the largest we accept
+            nbytes = MAX_ARCHIVE_BYTES
+        else:
+            nbytes = 0
+
+        user = await run_in_threadpool(get_current_user, request.headers.get("authorization", ""))
+        ticket = await admission_controller.acquire(user["nickname"], nbytes)
+    except HTTPException as e:
+        # Middleware runs outside FastAPI's exception handlers
+        return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+
+    try:
+        with without_deadline():
+            return await call_next(request)
+    finally:
+        admission_controller.release(ticket)
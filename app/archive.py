@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import io
+import lzma
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Dict, Optional, Set
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for .tar.zst uploads
+    zstandard = None
+
+from .models import PublishResponse
+from .publishing import UPLOAD_CHUNK_SIZE, open_proposal
+from .tracing import span
+from .utils import compute_upload_digest, safe_relative_path
+
+# Decoder and format errors only; I/O errors on our side must surface as 5xx
+ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, lzma.LZMAError, EOFError)
+if zstandard is not None:
+    ARCHIVE_ERRORS += (zstandard.ZstdError,)
+
+ZIP_METHODS = {zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA}
+
+MAX_ARCHIVE_ENTRIES = int(os.getenv("HEDA_ARCHIVE_MAX_ENTRIES", "20000"))
+MAX_ARCHIVE_BYTES = int(os.getenv("HEDA_ARCHIVE_MAX_BYTES", str(5 * 1024 ** 3)))
+
+ARCHIVE_FORMATS = {
+    "application/x-tar": "tar",
+    "application/gzip": "tar.gz",
+    "application/x-gzip": "tar.gz",
+    "application/x-gtar": "tar.gz",
+    "application/zstd": "tar.zst",
+    "application/x-zstd": "tar.zst",
+    "application/zip": "zip",
+    "application/x-zip-compressed": "zip",
+}
+
+
+async def _anext(chunks: AsyncIterator[bytes]) -> bytes:
+    return await chunks.__anext__()
+
+
+class _AsyncStreamReader(io.RawIOBase):
+    """
+    Blocking file object over an async byte stream, for use from a worker
+    thread while the event loop keeps receiving the request body.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop):
+        self._chunks = chunks.__aiter__()
+        self._loop = loop
+        self._buffer = memoryview(b"")
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._eof:
+            future = asyncio.run_coroutine_threadsafe(_anext(self._chunks), self._loop)
+            try:
+                self._buffer = memoryview(future.result())
+            except StopAsyncIteration:
+                self._eof = True
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _read_entry(src: BinaryIO) -> bytes:
+    try:
+        return src.read(UPLOAD_CHUNK_SIZE)
+    except OSError as e:
+        # bz2 reports corrupt entry data as OSError
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+
+
+class _Extractor:
+    """
+    Writes archive entries below `dest`, hashing them on the way and enforcing
+    path and size limits.
+    """
+
+    def __init__(self, dest: Path):
+        self.dest = dest
+        self.digests: Dict[str, str] = {}
+        self.dirs: Set[str] = set()
+        self.total_bytes = 0
+
+    def add(self, name: str, src: BinaryIO) -> None:
+        try:
+            path = safe_relative_path(name)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        rel = str(path)
+        parents = [str(parent) for parent in path.parents][:-1]
+        if rel in self.dirs or any(parent in self.digests for parent in parents):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Archive has both a file and a directory at {rel}",
+            )
+
+        if rel not in self.digests and len(self.digests) >= MAX_ARCHIVE_ENTRIES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Archive has more than {MAX_ARCHIVE_ENTRIES} files",
+            )
+
+        dest = self.dest / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        h = hashlib.sha256()
+        with dest.open("wb") as out:
+            while chunk := _read_entry(src):
+                self.total_bytes += len(chunk)
+                if self.total_bytes > MAX_ARCHIVE_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Archive expands to more than {MAX_ARCHIVE_BYTES} bytes",
+                    )
+                h.update(chunk)
+                out.write(chunk)
+
+        self.digests[rel] = h.hexdigest()
+        self.dirs.update(parents)
+
+
+def _extract_tar(fileobj: BinaryIO, extractor: _Extractor, mode: str) -> None:
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+        for member in tar:
+            if member.isdir():
+                continue
+            if not member.isfile():
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unsupported archive entry type: {member.name}",
+                )
+            extractor.add(member.name, tar.extractfile(member))
+
+
+def _extract_zip(fileobj: BinaryIO, extractor: _Extractor) -> None:
+    # The zip central directory is at the end, so spool the body first
+    with tempfile.TemporaryFile() as spool:
+        while chunk := fileobj.read(UPLOAD_CHUNK_SIZE):
+            if spool.tell() + len(chunk) > MAX_ARCHIVE_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Archive is larger than {MAX_ARCHIVE_BYTES} bytes",
+                )
+            spool.write(chunk)
+        spool.seek(0)
+
+        with zipfile.ZipFile(spool) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if stat.S_ISLNK(info.external_attr >> 16):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Unsupported archive entry type: {info.filename}",
+                    )
+                if info.flag_bits & 0x1 or info.compress_type not in ZIP_METHODS:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Unsupported zip entry encoding: {info.filename}",
+                    )
+                with archive.open(info) as src:
+                    extractor.add(info.filename, src)
+
+
+def extract_archive(fileobj: BinaryIO, archive_format: str, dest: Path) -> Dict[str, str]:
+    """
+    Extract an archive stream into `dest` and return {path: sha256}.
+    """
+    extractor = _Extractor(dest)
+
+    try:
+        if archive_format == "tar":
+            _extract_tar(fileobj, extractor, "r|")
+        elif archive_format == "tar.gz":
+            _extract_tar(fileobj, extractor, "r|gz")
+        elif archive_format == "tar.zst":
+            reader = zstandard.ZstdDecompressor().stream_reader(fileobj)
+            _extract_tar(reader, extractor, "r|")
+        else:
+            _extract_zip(fileobj, extractor)
+    except ARCHIVE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+
+    if not extractor.digests:
+        raise HTTPException(status_code=400, detail="Archive contains no files")
+
+    return extractor.digests
+
+
+def archive_format_for(content_type: Optional[str]) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    archive_format = ARCHIVE_FORMATS.get(media_type)
+
+    if archive_format is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Unsupported archive type '{media_type}'",
+        )
+    if archive_format == "tar.zst" and zstandard is None:
+        raise HTTPException(
+            status_code=415,
+            detail="zstd archives require the 'zstandard' package",
+        )
+    return archive_format
+
+
+async def publish_archive_backend(
+    experiment_name: str,
+    content_type: Optional[str],
+    body: AsyncIterator[bytes],
+    github_username: str,
+    user_id: str,
+    idempotency_key: Optional[str] = None,
+) -> PublishResponse:
+
+    repo_name = f"{github_username}-{experiment_name}"
+    archive_format = archive_format_for(content_type)
+    staging_dir = Path(tempfile.mkdtemp(prefix="heda-archive-"))
+
+    try:
+        # Extract while the body is still arriving; hashes come for free
+        reader = io.BufferedReader(
+            _AsyncStreamReader(body, asyncio.get_running_loop()),
+            buffer_size=UPLOAD_CHUNK_SIZE,
+        )
+        with span("archive.extract"):
+            digests = await run_in_threadpool(
+                extract_archive, reader, archive_format, staging_dir
+            )
+        proposal_digest = compute_upload_digest(digests.items())
+
+        def move_files_sync(tmp_dir: Path) -> Dict[str, str]:
+            for rel in digests:
+                dest = tmp_dir / rel
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(staging_dir / rel, dest)
+            return digests
+
+        async def move_files(tmp_dir: Path) -> Dict[str, str]:
+            return await run_in_threadpool(move_files_sync, tmp_dir)
+
+        return await open_proposal(
+            repo_name,
+            proposal_digest,
+            move_files,
+            github_username,
+            user_id,
+            idempotency_key,
+        )
+
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
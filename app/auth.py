@@ -1,19 +1,21 @@
 from datetime import time
 import os
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 from fastapi import HTTPException, Header
 from jose import jwt
 from jose.exceptions import JWTError
-from functools import lru_cache
-import requests
+import hashlib
 from dotenv import load_dotenv
 from typing import Tuple
 
 import os
-import requests
 from fastapi import HTTPException
 
+from app.cache import cache
+from app.resilience import call
+from app.tracing import traced
+
 
 load_dotenv()
 
@@ -28,36 +30,72 @@ AUTH0_DOMAIN = os.environ.get("AUTH0_DOMAIN")  # e.g., dev-xxxx.us.auth0.com
 AUTH0_AUDIENCE = os.environ.get("AUTH0_AUDIENCE")  # e.g., https://heda.example.com/api
 
 JWKS_URL = f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
+JWKS_TTL_SECONDS = 3600
+JWKS_MAX_STALE_SECONDS = 24 * 3600
+# Unknown kids are attacker controlled; refetch for them at most this often
+JWKS_REFRESH_INTERVAL_SECONDS = 60
 
 
-@lru_cache()
-def get_jwks():
-    resp = requests.get(JWKS_URL)
+@traced("auth0.jwks")
+def _fetch_jwks():
+    resp = call("auth0", "GET", JWKS_URL, timeout=5, hedge=True)
     resp.raise_for_status()
     return resp.json()
 
-def verify_token(token: str) -> dict:
+
+def get_jwks():
+    # Auth data keeps being served from cache while Auth0/GitHub are down
+    return cache.get_or_load(
+        "jwks", AUTH0_DOMAIN, _fetch_jwks, ttl=JWKS_TTL_SECONDS, max_stale=JWKS_MAX_STALE_SECONDS
+    )
+
+
+def _refresh_jwks() -> Optional[dict]:
     """
-    Verifies the JWT from Auth0 and returns the payload.
-    Raises HTTPException(401) if invalid.
+    Refetch the JWKS after signing keys may have rotated. Returns None if a
+    refresh ran recently (in any worker) or Auth0 is unavailable; the cached
+    set is never dropped.
     """
+    if not cache.throttle(f"jwks:{AUTH0_DOMAIN}", JWKS_REFRESH_INTERVAL_SECONDS):
+        return None
     try:
-        unverified_header = jwt.get_unverified_header(token)
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid JWT header")
+        jwks = _fetch_jwks()
+    except Exception:
+        return None
+    cache.set("jwks", AUTH0_DOMAIN, jwks, ttl=JWKS_TTL_SECONDS, max_stale=JWKS_MAX_STALE_SECONDS)
+    return jwks
+
 
-    jwks = get_jwks()
-    rsa_key = {}
+def _find_rsa_key(jwks: dict, kid: str) -> dict:
     for key in jwks["keys"]:
-        if key["kid"] == unverified_header.get("kid"):
-            rsa_key = {
+        if key["kid"] == kid:
+            return {
                 "kty": key["kty"],
                 "kid": key["kid"],
                 "use": key["use"],
                 "n": key["n"],
                 "e": key["e"]
             }
-            break
+    return {}
+
+@traced("auth.verify_token")
+def verify_token(token: str) -> dict:
+    """
+    Verifies the JWT from Auth0 and returns the payload.
+    Raises HTTPException(401) if invalid.
+    """
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid JWT header")
+
+    kid = unverified_header.get("kid")
+    rsa_key = _find_rsa_key(get_jwks(), kid)
+    if not rsa_key:
+        # Signing keys may have rotated since the JWKS was cached
+        refreshed = _refresh_jwks()
+        if refreshed:
+            rsa_key = _find_rsa_key(refreshed, kid)
     if not rsa_key:
         raise HTTPException(status_code=401, detail="Public key not found")
 
@@ -75,6 +113,7 @@ def verify_token(token: str) -> dict:
     return payload
 
 
+@traced("auth.current_user")
 def get_current_user(authorization: str = Header(...)) -> Dict:
     """
     Verify Auth0 access token and return full JWT payload.
@@ -134,43 +173,68 @@ def extract_user_id(
 
     return provider, user_id
 
-def get_userinfo(token: str) -> Dict:
-    r = requests.get(
+@traced("auth0.userinfo")
+def _fetch_userinfo(token: str) -> Dict:
+    r = call(
+        "auth0",
+        "GET",
         f"https://{AUTH0_DOMAIN}/userinfo",
         headers={"Authorization": f"Bearer {token}"},
         timeout=5,
+        hedge=True,
     )
     r.raise_for_status()
     return r.json()
 
 
+def get_userinfo(token: str) -> Dict:
+    key = hashlib.sha256(token.encode()).hexdigest()
+    return dict(cache.get_or_load(
+        "userinfo", key, lambda: _fetch_userinfo(token), ttl=60, max_stale=15 * 60
+    ))
+
+
+@traced("github.membership")
 def check_github_org_membership(github_username: str) -> None:
     """
     Ensure that the given GitHub username is a member of the organization.
     Raises HTTPException(403) if not authorized.
     """
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-    url = f"https://api.github.com/orgs/{GITHUB_ORG}/members/{github_username}"
-    resp = requests.get(url, headers=headers, timeout=5)
-
-    if resp.status_code == 404:
+    def fetch_membership_status() -> int:
+        headers = {
+            "Authorization": f"token {GITHUB_TOKEN}",
+            "Accept": "application/vnd.github.v3+json",
+        }
+        url = f"https://api.github.com/orgs/{GITHUB_ORG}/members/{github_username}"
+        resp = call("github", "GET", url, headers=headers, timeout=5, hedge=True)
+
+        if resp.status_code not in (204, 404):
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to verify org membership: {resp.status_code} {resp.text}"
+            )
+        return resp.status_code
+
+    # 204 means user is a member
+    status = cache.get_or_load(
+        "membership", github_username, fetch_membership_status, ttl=300, max_stale=3600
+    )
+    if status == 404:
         raise HTTPException(
             status_code=403,
             detail=f"User '{github_username}' is not a member of '{GITHUB_ORG}'",
         )
-    elif resp.status_code != 204:
-        # 204 means user is a member
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to verify org membership: {resp.status_code} {resp.text}"
-        )
 
 
 def get_management_api_token() -> str:
-    resp = requests.post(
+    return cache.get_or_load("auth0_mgmt_token", CLIENT_ID, _fetch_management_api_token, ttl=3600)
+
+
+@traced("auth0.token")
+def _fetch_management_api_token() -> str:
+    resp = call(
+        "auth0",
+        "POST",
         f"https://{AUTH0_DOMAIN}/oauth/token",
         json={
             "client_id": CLIENT_ID,
@@ -184,15 +248,19 @@ def get_management_api_token() -> str:
     return resp.json()["access_token"]
 
 
+@traced("auth0.github_token")
 def get_github_token_for_user(user_id: str) -> str:
     mgmt_token = get_management_api_token()
 
-    resp = requests.get(
+    resp = call(
+        "auth0",
+        "GET",
         f"https://{AUTH0_DOMAIN}/api/v2/users/{user_id}",
         headers={
             "Authorization": f"Bearer {mgmt_token}"
         },
         timeout=10,
+        hedge=True,
     )
     resp.raise_for_status()
     user = resp.json()
@@ -0,0 +1,321 @@
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+BLOBSTORE_DIR = os.getenv("HEDA_BLOBSTORE_DIR")
+BLOB_THRESHOLD = int(os.getenv("HEDA_BLOB_THRESHOLD", str(10 * 1024 * 1024)))
+BLOB_GC_GRACE_SECONDS = int(os.getenv("HEDA_BLOB_GC_GRACE_SECONDS", str(24 * 60 * 60)))
+
+POINTER_VERSION = "version heda-blob/v1"
+POINTER_MAX_SIZE = 200
+CHUNK_SIZE = 1024 * 1024
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_POINTER_RE = re.compile(
+    rf"^{re.escape(POINTER_VERSION)}\noid sha256:([0-9a-f]{{64}})\nsize (\d+)\n$"
+)
+
+
+def pointer_text(sha256: str, size: int) -> str:
+    return f"{POINTER_VERSION}\noid sha256:{sha256}\nsize {size}\n"
+
+
+def parse_pointer(data: bytes) -> Optional[Tuple[str, int]]:
+    """
+    Return (sha256, size) if `data` is a blob pointer file, else None.
+    """
+    if len(data) > POINTER_MAX_SIZE:
+        return None
+    match = _POINTER_RE.match(data.decode(errors="replace"))
+    if not match:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=" Range header into an inclusive (start, end).
+    Returns None for headers that should be ignored (multiple ranges) and
+    raises ValueError if the range is not satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        suffix = int(last)
+        if suffix <= 0:
+            raise ValueError(header)
+        return max(size - suffix, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+def read_pointer(path: Path) -> Optional[Tuple[str, int]]:
+    if path.stat().st_size > POINTER_MAX_SIZE:
+        return None
+    return parse_pointer(path.read_bytes())
+
+
+class BlobStore:
+    """
+    Content-addressed store for large experiment files.
+
+    Objects live under objects/<aa>/<bb>/<sha256>. References are rows of
+    (repo, ref, path) -> sha256 in a SQLite database, where ref is either a
+    publish branch or "main"; a blob with no rows is garbage once it is older
+    than the grace period.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.objects_dir = root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = root / "refs.sqlite3"
+        self._gc_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="heda-blob-gc")
+        self._gc_queued = False
+        self._gc_lock = threading.Lock()
+
+        with self._connect() as db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS refs (
+                    repo_name TEXT NOT NULL,
+                    ref TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    pr_number INTEGER,
+                    PRIMARY KEY (repo_name, ref, path)
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS refs_sha256 ON refs (sha256)")
+            db.execute("CREATE INDEX IF NOT EXISTS refs_pr ON refs (repo_name, pr_number)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / sha256[2:4] / sha256
+
+    def has(self, sha256: str) -> bool:
+        return self.object_path(sha256).exists()
+
+    def referenced_object(self, repo_name: str, sha256: str, size: int) -> Optional[Path]:
+        """
+        Path of an object `repo_name` already references and whose size is
+        `size`, else None. Objects referenced only by other repos are never
+        returned, so knowing a digest is not enough to obtain its content.
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT 1 FROM refs WHERE repo_name = ? AND sha256 = ? LIMIT 1",
+                (repo_name, sha256),
+            ).fetchone()
+        if not row:
+            return None
+
+        path = self.object_path(sha256)
+        try:
+            if path.stat().st_size != size:
+                return None
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put_file(self, src: Path, sha256: str) -> None:
+        """
+        Copy `src` into the store unless an identical object already exists.
+        """
+        dest = self.object_path(sha256)
+        if dest.exists():
+            # Refresh mtime so a concurrent GC keeps the object
+            os.utime(dest)
+            return
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest.with_name(f".{uuid.uuid4().hex}.part")
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dest)
+
+    def externalize(
+        self,
+        repo_name: str,
+        ref: str,
+        work_tree: Path,
+        written: Dict[str, str],
+    ) -> int:
+        """
+        Replace written files above BLOB_THRESHOLD with pointer files and
+        reference their content from `ref`. Returns the number of bytes kept
+        out of the commit.
+        """
+        saved = 0
+        rows = []
+
+        for rel, sha256 in written.items():
+            path = work_tree / rel
+            size = path.stat().st_size
+            if size <= BLOB_THRESHOLD:
+                pointer = read_pointer(path)
+                if pointer:
+                    rows.append((repo_name, ref, rel, pointer[0]))
+                continue
+
+            self.put_file(path, sha256)
+            path.write_text(pointer_text(sha256, size))
+            rows.append((repo_name, ref, rel, sha256))
+            saved += size
+
+        if rows:
+            with self._connect() as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO refs (repo_name, ref, path, sha256) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+        return saved
+
+    def attach_pr(self, repo_name: str, ref: str, pr_number: int) -> None:
+        with self._connect() as db:
+            db.execute(
+                "UPDATE refs SET pr_number = ? WHERE repo_name = ? AND ref = ?",
+                (pr_number, repo_name, ref),
+            )
+
+    def release_ref(self, repo_name: str, ref: str) -> None:
+        """
+        Drop references of a branch that never got a PR, e.g. because the
+        push or PR creation failed.
+        """
+        with self._connect() as db:
+            db.execute(
+                "DELETE FROM refs WHERE repo_name = ? AND ref = ? AND pr_number IS NULL",
+                (repo_name, ref),
+            )
+
+    def release_pr(self, repo_name: str, pr_number: int, merged: bool) -> None:
+        """
+        A PR left the open state: on merge its references move to main,
+        otherwise they are dropped.
+        """
+        with self._connect() as db:
+            if merged:
+                db.execute(
+                    """
+                    DELETE FROM refs
+                    WHERE repo_name = ? AND ref = 'main' AND path IN (
+                        SELECT path FROM refs WHERE repo_name = ? AND pr_number = ?
+                    )
+                    """,
+                    (repo_name, repo_name, pr_number),
+                )
+                db.execute(
+                    "UPDATE refs SET ref = 'main', pr_number = NULL WHERE repo_name = ? AND pr_number = ?",
+                    (repo_name, pr_number),
+                )
+            else:
+                db.execute(
+                    "DELETE FROM refs WHERE repo_name = ? AND pr_number = ?",
+                    (repo_name, pr_number),
+                )
+
+    def sync_main(self, repo_name: str, pointers: Dict[str, str]) -> None:
+        """
+        Replace the main references of `repo_name` with `pointers`
+        ({path: sha256} of the pointer files on main), so files deleted from
+        main or no longer externalized stop holding their objects.
+        """
+        with self._connect() as db:
+            db.execute("DELETE FROM refs WHERE repo_name = ? AND ref = 'main'", (repo_name,))
+            db.executemany(
+                "INSERT OR REPLACE INTO refs (repo_name, ref, path, sha256) VALUES (?, 'main', ?, ?)",
+                [(repo_name, path, sha256) for path, sha256 in pointers.items()],
+            )
+
+    def refcount(self, sha256: str) -> int:
+        with self._connect() as db:
+            (count,) = db.execute(
+                "SELECT COUNT(*) FROM refs WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+        return count
+
+    def collect_garbage(self, grace_seconds: int = BLOB_GC_GRACE_SECONDS) -> int:
+        """
+        Delete unreferenced objects older than the grace period and return
+        the number of bytes freed.
+        """
+        with self._connect() as db:
+            live = {row[0] for row in db.execute("SELECT DISTINCT sha256 FROM refs")}
+
+        cutoff = time.time() - grace_seconds
+        freed = 0
+        for path in self.objects_dir.glob("*/*/*"):
+            try:
+                st = path.stat()
+                if path.name not in live and st.st_mtime < cutoff:
+                    path.unlink()
+                    freed += st.st_size
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def schedule_gc(self) -> None:
+        """
+        Run collect_garbage in the background. Requests made while a run is
+        already queued are folded into it.
+        """
+        with self._gc_lock:
+            if self._gc_queued:
+                return
+            self._gc_queued = True
+        self._gc_executor.submit(self._run_gc)
+
+    def _run_gc(self) -> None:
+        with self._gc_lock:
+            self._gc_queued = False
+        try:
+            freed = self.collect_garbage()
+        except Exception as e:
+            print(f"Blob GC failed: {e}")
+            return
+        if freed:
+            print(f"Blob GC freed {freed} bytes")
+
+    def open_range(
+        self, sha256: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        Yield the bytes [start, end] (inclusive) of an object.
+        """
+        with self.object_path(sha256).open("rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+
+blob_store = BlobStore(Path(BLOBSTORE_DIR)) if BLOBSTORE_DIR else None
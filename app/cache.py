@@ -0,0 +1,352 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from fastapi import HTTPException
+
+try:
+    import redis
+except ImportError:  # optional, only needed for HEDA_CACHE_BACKEND=redis
+    redis = None
+
+CACHE_BACKEND = os.getenv("HEDA_CACHE_BACKEND", "memory")  # memory | sqlite | redis
+CACHE_SQLITE_PATH = Path(os.getenv("HEDA_CACHE_SQLITE_PATH", "data/cache/heda-cache.sqlite3"))
+CACHE_REDIS_URL = os.getenv("HEDA_CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_LOCAL_TTL_SECONDS = float(os.getenv("HEDA_CACHE_LOCAL_TTL_SECONDS", "5"))
+CACHE_MAX_ENTRIES = int(os.getenv("HEDA_CACHE_MAX_ENTRIES", "10000"))
+
+LOCK_TTL_SECONDS = 30
+LOCK_WAIT_SECONDS = 10
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+    def dumps(self) -> str:
+        return json.dumps([self.value, self.fresh_until, self.stale_until])
+
+    @classmethod
+    def loads(cls, raw) -> "CacheEntry":
+        value, fresh_until, stale_until = json.loads(raw)
+        return cls(value, fresh_until, stale_until)
+
+
+class MemoryBackend:
+    """
+    Per-process LRU. Locks only exclude threads of this process.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._locks: Dict[str, tuple] = {}
+        self._mutex = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._mutex:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            entry, expires_at = item
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry, expires_at: Optional[float] = None) -> None:
+        with self._mutex:
+            self._entries[key] = (entry, expires_at or entry.stale_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._mutex:
+            self._entries.pop(key, None)
+
+    def try_lock(self, name: str, token: str, ttl: float) -> bool:
+        now = time.time()
+        with self._mutex:
+            held = self._locks.get(name)
+            if held and held[1] > now:
+                return False
+            self._locks[name] = (token, now + ttl)
+            return True
+
+    def unlock(self, name: str, token: str) -> None:
+        with self._mutex:
+            if self._locks.get(name, (None,))[0] == token:
+                del self._locks[name]
+
+
+class SQLiteBackend:
+    """
+    Shared by all workers on one host through a WAL-mode SQLite file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS locks ("
+            "name TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        return db
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        row = self._db().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires_at >= ?",
+            (key, time.time()),
+        ).fetchone()
+        return CacheEntry.loads(row[0]) if row else None
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, entry.dumps(), entry.stale_until),
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            db.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, key: str) -> None:
+        self._db().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def try_lock(self, name: str, token: str, ttl: float) -> bool:
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM locks WHERE name = ? AND expires_at < ?", (name, now))
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO locks (name, token, expires_at) VALUES (?, ?, ?)",
+                (name, token, now + ttl),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def unlock(self, name: str, token: str) -> None:
+        self._db().execute("DELETE FROM locks WHERE name = ? AND token = ?", (name, token))
+
+
+class RedisBackend:
+    """
+    Shared across hosts through any Redis-protocol server.
+    """
+
+    _UNLOCK_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, url: str):
+        self._redis = redis.Redis.from_url(url)
+        self._unlock = self._redis.register_script(self._UNLOCK_SCRIPT)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raw = self._redis.get(f"heda:cache:{key}")
+        return CacheEntry.loads(raw) if raw else None
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        ttl_ms = max(1, int((entry.stale_until - time.time()) * 1000))
+        self._redis.set(f"heda:cache:{key}", entry.dumps(), px=ttl_ms)
+
+    def delete(self, key: str) -> None:
+        self._redis.delete(f"heda:cache:{key}")
+
+    def try_lock(self, name: str, token: str, ttl: float) -> bool:
+        return bool(self._redis.set(f"heda:lock:{name}", token, nx=True, px=int(ttl * 1000)))
+
+    def unlock(self, name: str, token: str) -> None:
+        self._unlock(keys=[f"heda:lock:{name}"], args=[token])
+
+
+class Cache:
+    """
+    TTL cache with stale-while-revalidate and single-flight loading.
+
+    A shared backend (SQLite or Redis) is fronted by a short-lived in-process
+    tier. Loads of the same key are coalesced across threads and, with a
+    shared backend, across worker processes; stale values are served while
+    one caller refreshes them, and during an outage of the loader's
+    dependency until `max_stale` runs out.
+    """
+
+    def __init__(self, backend, local: Optional[MemoryBackend] = None):
+        self.backend = backend
+        self.local = local
+        self.metrics: Dict[str, Counter] = defaultdict(Counter)
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="heda-cache")
+
+    def _get(self, key: str) -> Optional[CacheEntry]:
+        if self.local:
+            entry = self.local.get(key)
+            if entry:
+                return entry
+
+        entry = self.backend.get(key)
+        if entry and self.local:
+            self.local.set(key, entry, min(entry.stale_until, time.time() + CACHE_LOCAL_TTL_SECONDS))
+        return entry
+
+    def _set(self, key: str, value: Any, ttl: float, max_stale: float) -> None:
+        now = time.time()
+        entry = CacheEntry(value, now + ttl, now + ttl + max_stale)
+        self.backend.set(key, entry)
+        if self.local:
+            self.local.set(key, entry, min(entry.stale_until, now + CACHE_LOCAL_TTL_SECONDS))
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float, max_stale: float = 0) -> None:
+        self._set(f"{namespace}:{key}", value, ttl, max_stale)
+
+    def delete(self, namespace: str, key: str) -> None:
+        full_key = f"{namespace}:{key}"
+        self.backend.delete(full_key)
+        if self.local:
+            self.local.delete(full_key)
+
+    @contextmanager
+    def lock(self, name: str, timeout: float = LOCK_WAIT_SECONDS, ttl: float = LOCK_TTL_SECONDS) -> Iterator[bool]:
+        """
+        Mutual exclusion shared by every process using the backend. Yields
+        False if the lock could not be taken within `timeout`.
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        acquired = self.backend.try_lock(name, token, ttl)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+            acquired = self.backend.try_lock(name, token, ttl)
+
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.backend.unlock(name, token)
+
+    @contextmanager
+    def exclusive(self, name: str, timeout: float = LOCK_WAIT_SECONDS) -> Iterator[None]:
+        """
+        Like lock(), for read-modify-write sections that must not run
+        unprotected: raises HTTPException(503) if the lock is not acquired.
+        Blocks while waiting, so call it from a worker thread.
+        """
+        with self.lock(name, timeout) as acquired:
+            if not acquired:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server busy, retry later",
+                    headers={"Retry-After": "1"},
+                )
+            yield
+
+    def throttle(self, name: str, interval: float) -> bool:
+        """
+        True at most once per `interval` seconds for `name`, across every
+        process using the backend.
+        """
+        return self.backend.try_lock(f"throttle:{name}", uuid.uuid4().hex, interval)
+
+    def _load(self, namespace: str, key: str, loader: Callable[[], Any], ttl: float, max_stale: float):
+        with self.lock(f"load:{key}") as acquired:
+            if acquired:
+                # Another thread or worker may have loaded it while we waited
+                entry = self._get(key)
+                if entry and time.time() < entry.fresh_until:
+                    self.metrics[namespace]["coalesced"] += 1
+                    return entry.value
+
+            self.metrics[namespace]["loads"] += 1
+            try:
+                value = loader()
+            except Exception:
+                self.metrics[namespace]["load_errors"] += 1
+                raise
+            self._set(key, value, ttl, max_stale)
+            return value
+
+    def _refresh(self, namespace: str, key: str, loader: Callable[[], Any], ttl: float, max_stale: float) -> None:
+        with self.lock(f"load:{key}", timeout=0) as acquired:
+            if not acquired:
+                return  # someone else is already refreshing
+            self.metrics[namespace]["refreshes"] += 1
+            try:
+                self._set(key, loader(), ttl, max_stale)
+            except Exception:
+                self.metrics[namespace]["load_errors"] += 1
+
+    def get_or_load(
+        self,
+        namespace: str,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: float,
+        max_stale: float = 0,
+    ) -> Any:
+        full_key = f"{namespace}:{key}"
+        entry = self._get(full_key)
+        now = time.time()
+
+        if entry and now < entry.fresh_until:
+            self.metrics[namespace]["hits"] += 1
+            return entry.value
+
+        if entry and now < entry.stale_until:
+            self.metrics[namespace]["stale_hits"] += 1
+            self._executor.submit(self._refresh, namespace, full_key, loader, ttl, max_stale)
+            return entry.value
+
+        self.metrics[namespace]["misses"] += 1
+        return self._load(namespace, full_key, loader, ttl, max_stale)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": CACHE_BACKEND,
+            "namespaces": {ns: dict(counter) for ns, counter in self.metrics.items()},
+        }
+
+
+def build_cache() -> Cache:
+    if CACHE_BACKEND == "sqlite":
+        return Cache(SQLiteBackend(CACHE_SQLITE_PATH), local=MemoryBackend())
+    if CACHE_BACKEND == "redis":
+        if redis is None:
+            raise RuntimeError("HEDA_CACHE_BACKEND=redis requires the 'redis' package")
+        return Cache(RedisBackend(CACHE_REDIS_URL), local=MemoryBackend())
+    return Cache(MemoryBackend())
+
+
+cache = build_cache()
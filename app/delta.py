@@ -0,0 +1,355 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from .blobstore import blob_store, read_pointer
+from .config import GITHUB_ORG
+from .models import ManifestEntry, PublishManifestResponse, PublishResponse
+from .publishing import UPLOAD_CHUNK_SIZE, open_proposal
+from .tracing import span, traced
+from .utils import compute_upload_digest, run_git, safe_relative_path
+
+CACHE_DIR = Path("data/cache")
+REPO_CACHE_DIR = CACHE_DIR / "repos"
+STAGING_DIR = CACHE_DIR / "uploads"
+SESSION_DIR = CACHE_DIR / "sessions"
+
+for _dir in (REPO_CACHE_DIR, STAGING_DIR, SESSION_DIR):
+    _dir.mkdir(parents=True, exist_ok=True)
+
+SESSION_TTL_SECONDS = 60 * 60
+DIGEST_CACHE_VERSION = 3
+# Only regular files are hashed or copied; symlinks (120000) and submodules
+# would let main point the server at files outside the clone
+REGULAR_FILE_MODES = {"100644", "100755"}
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_repo_locks: Dict[str, threading.Lock] = {}
+_repo_locks_guard = threading.Lock()
+
+
+def _repo_lock(repo_name: str) -> threading.Lock:
+    with _repo_locks_guard:
+        lock = _repo_locks.get(repo_name)
+        if lock is None:
+            lock = _repo_locks[repo_name] = threading.Lock()
+        return lock
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def repo_cache_dir(repo_name: str) -> Path:
+    return REPO_CACHE_DIR / repo_name
+
+
+def staging_dir(github_username: str) -> Path:
+    """
+    Staged blobs are kept per user, so the manifest response cannot reveal
+    what other users have uploaded.
+    """
+    return STAGING_DIR / github_username
+
+
+@traced("delta.refresh_main")
+def refresh_main_tree(repo_name: str) -> Dict[str, str]:
+    """
+    Return {path: sha256} of the current main tree of `repo_name`.
+
+    A clone per repo is kept under data/cache and fast-forwarded on each call;
+    sha256 digests are remembered per git blob id so only changed blobs are
+    rehashed, and blob pointer files report the digest of their content.
+    Whenever main moved, the blob store's main references are rebuilt from
+    its pointer files. Callers must hold the repo lock.
+    """
+    cache_dir = repo_cache_dir(repo_name)
+    digests_path = REPO_CACHE_DIR / f"{repo_name}.json"
+    repo_url = f"https://github.com/{GITHUB_ORG}/{repo_name}.git"
+
+    if not (cache_dir / ".git").exists():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        run_git(
+            ["git", "clone", "--branch", "main", repo_url, str(cache_dir)],
+            cwd=Path("/"),
+        )
+    else:
+        run_git(["git", "fetch", "origin", "main"], cwd=cache_dir)
+        run_git(["git", "reset", "--hard", "FETCH_HEAD"], cwd=cache_dir)
+
+    commit = run_git(["git", "rev-parse", "HEAD"], cwd=cache_dir).strip()
+
+    cached = {"commit": None, "files": {}, "oids": {}, "pointer_oids": []}
+    if digests_path.exists():
+        cached = json.loads(digests_path.read_text())
+    if cached.get("version") == DIGEST_CACHE_VERSION and cached["commit"] == commit:
+        return cached["files"]
+
+    files: Dict[str, str] = {}
+    oids: Dict[str, str] = {}
+    pointer_oids = set(cached["pointer_oids"])
+    pointers: Dict[str, str] = {}
+    listing = run_git(["git", "ls-tree", "-r", "-z", "HEAD"], cwd=cache_dir)
+    for record in listing.split("\0"):
+        if not record:
+            continue
+        meta, path = record.split("\t", 1)
+        mode, kind, oid = meta.split()
+        if kind != "blob" or mode not in REGULAR_FILE_MODES:
+            continue
+        digest = cached["oids"].get(oid)
+        if not digest:
+            pointer = read_pointer(cache_dir / path)
+            digest = pointer[0] if pointer else _sha256_file(cache_dir / path)
+            if pointer:
+                pointer_oids.add(oid)
+        oids[oid] = digest
+        files[path] = digest
+        if oid in pointer_oids:
+            pointers[path] = digest
+
+    if blob_store:
+        blob_store.sync_main(repo_name, pointers)
+
+    digests_path.write_text(json.dumps({
+        "version": DIGEST_CACHE_VERSION,
+        "commit": commit,
+        "files": files,
+        "oids": oids,
+        "pointer_oids": sorted(pointer_oids & oids.keys()),
+    }))
+    return files
+
+
+def release_pr_blobs(repo_name: str, pr_number: int, merged: bool) -> None:
+    """
+    Release the blob references of a closed PR. After a merge the main
+    references are rebuilt from the merged tree, so files the PR replaced
+    with inline content or that left main no longer keep objects alive.
+    """
+    if not blob_store:
+        return
+    with _repo_lock(repo_name):
+        blob_store.release_pr(repo_name, pr_number, merged=merged)
+        if merged:
+            try:
+                refresh_main_tree(repo_name)
+            except Exception as e:
+                # Stale main references only delay GC; the next refresh fixes them
+                print(f"Could not rebuild main blob references of {repo_name}: {e}")
+
+
+def _staged_blob(github_username: str, digest: str, size: int) -> Optional[Path]:
+    staged = staging_dir(github_username) / digest
+    try:
+        # Refresh mtime so the blob outlives the session relying on it
+        os.utime(staged)
+        if staged.stat().st_size != size:
+            return None
+    except FileNotFoundError:
+        return None
+    return staged
+
+
+def _stored_blob(repo_name: str, digest: str, size: int) -> Optional[Path]:
+    if not blob_store:
+        return None
+    return blob_store.referenced_object(repo_name, digest, size)
+
+
+def _prune_expired() -> None:
+    cutoff = time.time() - SESSION_TTL_SECONDS
+    for path in list(SESSION_DIR.glob("*.json")) + list(STAGING_DIR.glob("*/*")):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def create_session(
+    repo_name: str,
+    github_username: str,
+    manifest: List[ManifestEntry],
+) -> PublishManifestResponse:
+    """
+    Phase 1 of a delta publish: compare the client manifest against main and
+    report which content digests must be uploaded.
+    """
+    if not manifest:
+        raise HTTPException(status_code=400, detail="Empty manifest")
+
+    entries = []
+    for entry in manifest:
+        try:
+            path = str(safe_relative_path(entry.path))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not SHA256_RE.match(entry.sha256) or entry.size < 0:
+            raise HTTPException(status_code=400, detail=f"Invalid manifest entry: {entry.path}")
+        entries.append({"path": path, "size": entry.size, "sha256": entry.sha256})
+
+    _prune_expired()
+
+    with _repo_lock(repo_name):
+        main_digests = set(refresh_main_tree(repo_name).values())
+
+    # Only content this user staged or their repo already holds counts as
+    # present; the blob store is shared and must not answer for other users
+    missing = sorted({
+        e["sha256"] for e in entries
+        if e["sha256"] not in main_digests
+        and not _staged_blob(github_username, e["sha256"], e["size"])
+        and not _stored_blob(repo_name, e["sha256"], e["size"])
+    })
+
+    session_id = uuid.uuid4().hex
+    session = {
+        "repo_name": repo_name,
+        "github_username": github_username,
+        "files": entries,
+    }
+    (SESSION_DIR / f"{session_id}.json").write_text(json.dumps(session))
+
+    return PublishManifestResponse(session_id=session_id, missing=missing)
+
+
+def load_session(session_id: str, github_username: str) -> dict:
+    try:
+        session_id = uuid.UUID(session_id).hex
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Unknown publish session")
+
+    path = SESSION_DIR / f"{session_id}.json"
+    if not path.exists() or path.stat().st_mtime < time.time() - SESSION_TTL_SECONDS:
+        raise HTTPException(status_code=404, detail="Unknown publish session")
+
+    session = json.loads(path.read_text())
+    if session["github_username"] != github_username:
+        raise HTTPException(status_code=403, detail="Publish session belongs to another user")
+
+    session["id"] = session_id
+    return session
+
+
+def stage_blobs(session: dict, files: List[UploadFile]) -> None:
+    """
+    Phase 2: store uploaded blobs under their sha256, rejecting content that
+    is not part of the session manifest. Blocks; run it in the threadpool.
+    """
+    expected = {e["sha256"]: e["size"] for e in session["files"]}
+    user_staging_dir = staging_dir(session["github_username"])
+    user_staging_dir.mkdir(exist_ok=True)
+
+    for file in files:
+        tmp_path = user_staging_dir / f".{uuid.uuid4().hex}.part"
+        h = hashlib.sha256()
+        size = 0
+        try:
+            with tmp_path.open("wb") as out:
+                while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+                    h.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+
+            digest = h.hexdigest()
+            if expected.get(digest) != size:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Uploaded blob '{file.filename}' does not match the manifest",
+                )
+            os.replace(tmp_path, user_staging_dir / digest)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+
+def assemble_proposal(session: dict, tmp_dir: Path) -> Dict[str, str]:
+    """
+    Write manifest entries that differ from main into the work tree, taking
+    content from staged uploads, identical files already on main or the blob
+    store, and return {path: sha256} of the files written.
+    Raises HTTPException(409) if some content is unavailable, e.g. because
+    main moved since the manifest was posted.
+    """
+    repo_name = session["repo_name"]
+    github_username = session["github_username"]
+
+    with _repo_lock(repo_name):
+        main_files = refresh_main_tree(repo_name)
+        by_digest = {digest: path for path, digest in main_files.items()}
+        cache_dir = repo_cache_dir(repo_name)
+
+        written = {}
+        missing = set()
+        for entry in session["files"]:
+            path, digest = entry["path"], entry["sha256"]
+            if main_files.get(path) == digest:
+                continue
+
+            src = _staged_blob(github_username, digest, entry["size"])
+            if src is None and digest in by_digest:
+                src = cache_dir / by_digest[digest]
+            if src is None:
+                src = _stored_blob(repo_name, digest, entry["size"])
+            if src is None:
+                missing.add(digest)
+                continue
+
+            dest = tmp_dir / path
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(src, dest)
+            written[path] = digest
+
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Missing content, re-send the manifest", "missing": sorted(missing)},
+        )
+    return written
+
+
+async def publish_delta_backend(
+    session_id: str,
+    files: List[UploadFile],
+    github_username: str,
+    user_id: str,
+    idempotency_key: Optional[str] = None,
+) -> PublishResponse:
+    session = load_session(session_id, github_username)
+
+    with span("delta.stage_blobs"):
+        await run_in_threadpool(stage_blobs, session, files)
+
+    proposal_digest = compute_upload_digest(
+        (e["path"], e["sha256"]) for e in session["files"]
+    )
+
+    async def populate(tmp_dir: Path) -> Dict[str, str]:
+        return await run_in_threadpool(assemble_proposal, session, tmp_dir)
+
+    response = await open_proposal(
+        session["repo_name"],
+        proposal_digest,
+        populate,
+        github_username,
+        user_id,
+        idempotency_key,
+        clone_reference=repo_cache_dir(session["repo_name"]),
+    )
+
+    (SESSION_DIR / f"{session['id']}.json").unlink(missing_ok=True)
+    return response
@@ -0,0 +1,224 @@
+import os
+import stat
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .tracing import span
+from .utils import run_git
+
+try:
+    from dulwich.client import get_transport_and_path, default_urllib3_manager
+    from dulwich.objects import Blob, Commit, Tree
+    from dulwich.object_store import commit_tree_changes
+    from dulwich.repo import Repo, get_user_identity
+except ImportError:  # optional, only needed for HEDA_GIT_BACKEND=dulwich
+    Repo = None
+
+GIT_BACKEND = os.getenv("HEDA_GIT_BACKEND", "subprocess")
+CREDENTIALS_TTL_SECONDS = 300
+
+
+def host_credentials(repo_url: str) -> Optional[Tuple[str, str]]:
+    """
+    Ask the credential helpers configured for the host's git, i.e. the
+    identity the git CLI would use for `repo_url`. None if there is none.
+    """
+    url = urlsplit(repo_url)
+    query = f"protocol={url.scheme}\nhost={url.netloc}\npath={url.path.lstrip('/')}\n\n"
+    result = subprocess.run(
+        ["git", "credential", "fill"],
+        input=query.encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0", "GIT_ASKPASS": "", "SSH_ASKPASS": ""},
+    )
+    if result.returncode != 0:
+        return None
+
+    fields = dict(
+        line.split("=", 1) for line in result.stdout.decode().splitlines() if "=" in line
+    )
+    if "username" not in fields or "password" not in fields:
+        return None
+    return fields["username"], fields["password"]
+
+
+class SubprocessGitBackend:
+    """
+    Git operations through the git CLI, one fork per command.
+    """
+
+    def clone(self, repo_url: str, dest: Path, reference: Optional[Path] = None) -> None:
+        cmd = ["git", "clone"]
+        if reference and (reference / ".git").exists():
+            cmd += ["--reference", str(reference), "--dissociate"]
+        run_git(cmd + [repo_url, str(dest)], cwd=Path("/"))
+
+    def init(self, dest: Path, repo_url: str) -> None:
+        run_git(["git", "init"], cwd=dest)
+        run_git(["git", "remote", "add", "origin", repo_url], cwd=dest)
+
+    def commit(self, work_tree: Path, branch: str, paths: Iterable[str], message: str) -> None:
+        """
+        Commit `paths` on top of HEAD as the tip of a new `branch`.
+        """
+        run_git(["git", "checkout", "-B", branch], cwd=work_tree)
+
+        # Stage only the written paths instead of rescanning the tree
+        pathspec = work_tree / ".git" / "heda-pathspec"
+        pathspec.write_bytes(b"".join(p.encode() + b"\0" for p in paths))
+        run_git(
+            ["git", "add", f"--pathspec-from-file={pathspec}", "--pathspec-file-nul"],
+            cwd=work_tree,
+        )
+        run_git(["git", "commit", "-m", message], cwd=work_tree)
+
+    def push(self, work_tree: Path, branch: str) -> None:
+        run_git(["git", "push", "-u", "origin", branch], cwd=work_tree)
+
+
+class DulwichGitBackend:
+    """
+    In-process git: objects are written only for the given paths, commits and
+    refs are created without a work tree scan, and clone/push share one
+    keep-alive HTTP connection pool.
+
+    Clones fetch main only and skip checkout, so the work tree holds just
+    the files written by the caller.
+    """
+
+    def __init__(self):
+        self._pool = default_urllib3_manager(config=None)
+        self._credentials: Dict[str, Tuple[float, Optional[Tuple[str, str]]]] = {}
+
+    def _client(self, repo_url: str):
+        if not repo_url.startswith(("https://", "http://")):
+            return get_transport_and_path(repo_url)
+
+        # Same identity as the git CLI, resolved once per host for a while
+        host = urlsplit(repo_url).netloc
+        fetched_at, credentials = self._credentials.get(host, (0.0, None))
+        if time.monotonic() - fetched_at > CREDENTIALS_TTL_SECONDS:
+            credentials = host_credentials(repo_url)
+            self._credentials[host] = (time.monotonic(), credentials)
+
+        username, password = credentials or (None, None)
+        return get_transport_and_path(
+            repo_url,
+            username=username,
+            password=password,
+            pool_manager=self._pool,
+        )
+
+    def clone(self, repo_url: str, dest: Path, reference: Optional[Path] = None) -> None:
+        dest.mkdir(parents=True, exist_ok=True)
+        with span("git.clone"), Repo.init(str(dest)) as repo:
+            config = repo.get_config()
+            config.set((b"remote", b"origin"), b"url", repo_url.encode())
+            config.write_to_path()
+
+            borrowed = False
+            if reference and (reference / ".git").exists():
+                # Borrow objects from the local clone and advertise them as haves
+                with Repo(str(reference)) as ref_repo:
+                    repo.object_store.add_alternate_path(str(reference / ".git" / "objects"))
+                    if b"HEAD" in ref_repo.refs:
+                        repo.refs[b"refs/heads/main"] = ref_repo.head()
+                borrowed = True
+
+            def want_main(refs, depth=None):
+                return [refs[b"refs/heads/main"]] if b"refs/heads/main" in refs else []
+
+            client, path = self._client(repo_url)
+            result = client.fetch(path, repo, determine_wants=want_main)
+
+            main = result.refs.get(b"refs/heads/main")
+            if main:
+                repo.refs[b"refs/heads/main"] = main
+                repo.refs[b"refs/remotes/origin/main"] = main
+            repo.refs.set_symbolic_ref(b"HEAD", b"refs/heads/main")
+
+            if borrowed:
+                # Like --dissociate: copy what main needs, then drop the alternate
+                if main:
+                    repo.object_store.add_pack_data(
+                        *repo.object_store.generate_pack_data([], [main])
+                    )
+                else:
+                    repo.refs.remove_if_equals(b"refs/heads/main", None)
+                (dest / ".git" / "objects" / "info" / "alternates").unlink(missing_ok=True)
+
+    def init(self, dest: Path, repo_url: str) -> None:
+        with Repo.init(str(dest)) as repo:
+            config = repo.get_config()
+            config.set((b"remote", b"origin"), b"url", repo_url.encode())
+            config.write_to_path()
+
+    def commit(self, work_tree: Path, branch: str, paths: Iterable[str], message: str) -> None:
+        """
+        Commit `paths` on top of HEAD as the tip of a new `branch`.
+        """
+        with span("git.commit"), Repo(str(work_tree)) as repo:
+            try:
+                parent = repo.head()
+                tree = repo[repo[parent].tree]
+            except KeyError:
+                parent, tree = None, Tree()
+
+            blobs, changes = [], []
+            for rel in paths:
+                path = work_tree / rel
+                blob = Blob.from_string(path.read_bytes())
+                executable = path.stat().st_mode & stat.S_IXUSR
+                blobs.append((blob, None))
+                changes.append((rel.encode(), 0o100755 if executable else 0o100644, blob.id))
+            repo.object_store.add_objects(blobs)
+
+            base_tree = tree.id
+            commit = Commit()
+            commit.tree = commit_tree_changes(repo.object_store, tree, changes)
+            if commit.tree == base_tree:
+                # git commit refuses an empty change too
+                raise RuntimeError(f"Nothing to commit on {branch}")
+            commit.parents = [parent] if parent else []
+            commit.author = commit.committer = get_user_identity(repo.get_config_stack())
+            commit.author_time = commit.commit_time = int(time.time())
+            commit.author_timezone = commit.commit_timezone = 0
+            commit.message = message.encode() + b"\n"
+            repo.object_store.add_object(commit)
+
+            ref = b"refs/heads/" + branch.encode()
+            repo.refs[ref] = commit.id
+            repo.refs.set_symbolic_ref(b"HEAD", ref)
+
+    def push(self, work_tree: Path, branch: str) -> None:
+        with span("git.push"), Repo(str(work_tree)) as repo:
+            repo_url = repo.get_config().get((b"remote", b"origin"), b"url").decode()
+            ref = b"refs/heads/" + branch.encode()
+            sha = repo.refs[ref]
+
+            def update_refs(refs):
+                refs = dict(refs)
+                refs[ref] = sha
+                return refs
+
+            client, path = self._client(repo_url)
+            result = client.send_pack(path, update_refs, repo.generate_pack_data)
+
+            error = (result.ref_status or {}).get(ref)
+            if error:
+                raise RuntimeError(f"Failed to push {branch}: {error}")
+
+
+def get_git_backend():
+    if GIT_BACKEND == "dulwich":
+        if Repo is None:
+            raise RuntimeError("HEDA_GIT_BACKEND=dulwich requires the 'dulwich' package")
+        return DulwichGitBackend()
+    return SubprocessGitBackend()
+
+
+git_backend = get_git_backend()
@@ -2,8 +2,10 @@ import time
 from pathlib import Path
 
 import jwt
-import requests
 from app.config import GITHUB_APP_ID, GITHUB_PRIVATE_KEY_PATH
+from app.cache import cache
+from app.resilience import call
+from app.tracing import traced
 
 
 def create_app_jwt() -> str:
@@ -19,6 +21,17 @@ def create_app_jwt() -> str:
 
 
 def get_installation_token(installation_id: int) -> str:
+    # Installation tokens are valid for an hour
+    return cache.get_or_load(
+        "installation_token",
+        str(installation_id),
+        lambda: _fetch_installation_token(installation_id),
+        ttl=50 * 60,
+    )
+
+
+@traced("github.installation_token")
+def _fetch_installation_token(installation_id: int) -> str:
     jwt_token = create_app_jwt()
 
     headers = {
@@ -28,7 +41,7 @@ def get_installation_token(installation_id: int) -> str:
 
     url = f"https://api.github.com/app/installations/{installation_id}/access_tokens"
 
-    response = requests.post(url, headers=headers)
+    response = call("github", "POST", url, headers=headers, timeout=10)
     response.raise_for_status()
 
     return response.json()["token"]
@@ -2,14 +2,16 @@ from pathlib import Path
 import shutil
 import tempfile
 
-import requests
-from .utils import run_git
+from .git_backend import git_backend
 from github import GithubException
 from .config import org, ADMIN_GITHUB_TOKEN, GITHUB_ORG
+from .resilience import call
+from .tracing import span, traced
 
 from .templates.pr_verify import pr_verify_template
 from .templates.pr_finalize import pr_finalize_template
 
+@traced("github.protect_main")
 def protect_main_branch(repo_name: str):
     """
     Enforce PR-only merges and block direct pushes to main.
@@ -38,13 +40,14 @@ def protect_main_branch(repo_name: str):
         "restrictions": None
     }
 
-    response = requests.put(url, headers=headers, json=payload)
+    response = call("github", "PUT", url, headers=headers, json=payload, timeout=10)
 
     if response.status_code not in (200, 201):
         raise RuntimeError(
             f"Failed to protect main branch: {response.status_code} {response.text}"
         )
 
+@traced("github.create_repo")
 def create_gitops_repo(github_username: str, experiment_name: str) -> str:
     """
     Create an empty GitOps repository for experiment proposals.
@@ -68,6 +71,7 @@ def create_gitops_repo(github_username: str, experiment_name: str) -> str:
     return repo.clone_url
 
 
+@traced("init")
 def initialize_local_repo(repo_url: str, repo_name: str) -> None:
     """
     Initialize an empty GitOps repository with CI policy.
@@ -75,31 +79,34 @@ def initialize_local_repo(repo_url: str, repo_name: str) -> None:
     tmp_dir = Path(tempfile.mkdtemp(prefix="heda-init-"))
 
     try:
-        run_git(["git", "init"], cwd=tmp_dir)
-        run_git(["git", "remote", "add", "origin", repo_url], cwd=tmp_dir)
+        git_backend.init(tmp_dir, repo_url)
 
         # -----------------------------
         # GitHub Actions workflow
         # -----------------------------
-        pr_verify_path = tmp_dir / ".github/workflows/pr-verify.yml"
-        pr_verify_path.parent.mkdir(parents=True, exist_ok=True)
+        with span("write"):
+            pr_verify_path = tmp_dir / ".github/workflows/pr-verify.yml"
+            pr_verify_path.parent.mkdir(parents=True, exist_ok=True)
 
-        pr_verify_path.write_text(pr_verify_template)
-        
-        pr_finalize_path = tmp_dir / ".github/workflows/main-finalize.yml"
-        pr_finalize_path.parent.mkdir(parents=True, exist_ok=True)
-        pr_finalize_path.write_text(pr_finalize_template)
+            pr_verify_path.write_text(pr_verify_template)
+
+            pr_finalize_path = tmp_dir / ".github/workflows/main-finalize.yml"
+            pr_finalize_path.parent.mkdir(parents=True, exist_ok=True)
+            pr_finalize_path.write_text(pr_finalize_template)
 
         # -----------------------------
         # Initial policy commit
         # -----------------------------
-        run_git(["git", "add", "."], cwd=tmp_dir)
-        run_git(
-            ["git", "commit", "-m", "chore: initialize GitOps policy"],
-            cwd=tmp_dir,
+        git_backend.commit(
+            tmp_dir,
+            "main",
+            [
+                str(pr_verify_path.relative_to(tmp_dir)),
+                str(pr_finalize_path.relative_to(tmp_dir)),
+            ],
+            "chore: initialize GitOps policy",
         )
-        run_git(["git", "branch", "-M", "main"], cwd=tmp_dir)
-        run_git(["git", "push", "-u", "origin", "main"], cwd=tmp_dir)
+        git_backend.push(tmp_dir, "main")
         # Protect main branch programmatically
         protect_main_branch(repo_name)
 
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from requests import RequestException
+
+from .cache import cache
+from .config import ADMIN_GITHUB_TOKEN, GITHUB_ORG
+from .models import PublishResponse
+from .resilience import DependencyUnavailable, call
+
+PUBLISH_INDEX_DB = Path("data/publish_index.json")
+PUBLISH_INDEX_DB.parent.mkdir(exist_ok=True)
+
+# Index hits trust a PR seen open this recently; the pull_request webhook
+# drops closed PRs from the index in the meantime
+PR_STATE_TTL_SECONDS = 300
+
+# key -> (lock, number of holders and waiters)
+_proposal_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+
+def _proposal_key(repo_name: str, proposal_digest: str) -> str:
+    return f"{repo_name}:{proposal_digest}"
+
+
+def _idempotency_key(github_username: str, key: str) -> str:
+    return f"{github_username}:{key}"
+
+
+def load_publish_index() -> Dict[str, dict]:
+    if PUBLISH_INDEX_DB.exists():
+        return json.loads(PUBLISH_INDEX_DB.read_text())
+    return {"proposals": {}, "keys": {}}
+
+
+def save_publish_index(data: Dict[str, dict]):
+    tmp_path = PUBLISH_INDEX_DB.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2))
+    os.replace(tmp_path, PUBLISH_INDEX_DB)
+
+
+@asynccontextmanager
+async def proposal_lock(repo_name: str, proposal_digest: str) -> AsyncIterator[None]:
+    """
+    Serialize concurrent publishes of the same proposal so a retry that
+    races the original waits for it and then hits the index. The lock is
+    dropped once nobody holds or waits for it.
+    """
+    key = _proposal_key(repo_name, proposal_digest)
+    lock, users = _proposal_locks.get(key) or (asyncio.Lock(), 0)
+    _proposal_locks[key] = (lock, users + 1)
+    try:
+        async with lock:
+            yield
+    finally:
+        lock, users = _proposal_locks[key]
+        if users == 1:
+            del _proposal_locks[key]
+        else:
+            _proposal_locks[key] = (lock, users - 1)
+
+
+def find_open_proposal(
+    repo_name: str,
+    proposal_digest: str,
+    github_username: str,
+    idempotency_key: Optional[str] = None,
+) -> Optional[PublishResponse]:
+    """
+    Return the response of an already opened PR for this proposal, if any.
+    Raises HTTPException(422) if the Idempotency-Key was used for a
+    different payload.
+    """
+    with cache.exclusive("publish_index"):
+        index = load_publish_index()
+
+    if idempotency_key:
+        known = index["keys"].get(_idempotency_key(github_username, idempotency_key))
+        if known and known != _proposal_key(repo_name, proposal_digest):
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different proposal",
+            )
+
+    record = index["proposals"].get(_proposal_key(repo_name, proposal_digest))
+    if not record:
+        return None
+
+    # The PR may have been closed or merged by hand since it was recorded
+    if not _pr_is_open(repo_name, record["pr_number"]):
+        with cache.exclusive("publish_index"):
+            index = load_publish_index()
+            if _drop_pr(index, repo_name, record["pr_number"]):
+                save_publish_index(index)
+        return None
+
+    return PublishResponse(**record["response"])
+
+
+def _pr_is_open(repo_name: str, pr_number: int) -> bool:
+    """
+    Whether the PR is still open, as last seen within PR_STATE_TTL_SECONDS.
+    When GitHub cannot tell, the index is trusted so retries keep working
+    during an outage.
+    """
+    try:
+        return cache.get_or_load(
+            "pr_open",
+            f"{repo_name}#{pr_number}",
+            lambda: _fetch_pr_is_open(repo_name, pr_number),
+            ttl=PR_STATE_TTL_SECONDS,
+        )
+    except (DependencyUnavailable, RequestException) as e:
+        print(f"Could not check PR #{pr_number} of {repo_name}, trusting the index: {e}")
+        return True
+
+
+def _fetch_pr_is_open(repo_name: str, pr_number: int) -> bool:
+    url = f"https://api.github.com/repos/{GITHUB_ORG}/{repo_name}/pulls/{pr_number}"
+
+    headers = {
+        "Authorization": f"token {ADMIN_GITHUB_TOKEN}",
+        "Accept": "application/vnd.github+json",
+    }
+
+    res = call("github", "GET", url, headers=headers, timeout=10, hedge=True)
+    if res.status_code == 404:
+        return False
+    res.raise_for_status()
+
+    return res.json()["state"] == "open"
+
+
+def record_proposal(
+    repo_name: str,
+    proposal_digest: str,
+    github_username: str,
+    pr_number: int,
+    response: PublishResponse,
+    idempotency_key: Optional[str] = None,
+) -> None:
+    key = _proposal_key(repo_name, proposal_digest)
+
+    with cache.exclusive("publish_index"):
+        index = load_publish_index()
+        index["proposals"][key] = {
+            "repo_name": repo_name,
+            "pr_number": pr_number,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "response": response.dict(),
+        }
+        if idempotency_key:
+            index["keys"][_idempotency_key(github_username, idempotency_key)] = key
+        save_publish_index(index)
+
+
+def _drop_pr(index: Dict[str, dict], repo_name: str, pr_number: int) -> set:
+    stale = {
+        key for key, record in index["proposals"].items()
+        if record["repo_name"] == repo_name and record["pr_number"] == pr_number
+    }
+    for key in stale:
+        del index["proposals"][key]
+    if stale:
+        index["keys"] = {
+            k: v for k, v in index["keys"].items() if v not in stale
+        }
+    return stale
+
+
+def forget_pr(repo_name: str, pr_number: int) -> None:
+    """
+    Drop index entries of a PR that is no longer open (merged or closed),
+    so the same content can be proposed again.
+    """
+    with cache.exclusive("publish_index"):
+        index = load_publish_index()
+        if _drop_pr(index, repo_name, pr_number):
+            save_publish_index(index)
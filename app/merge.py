@@ -1,6 +1,9 @@
-import requests
-
+from app.blobstore import blob_store
+from app.delta import release_pr_blobs
 from app.github_auth import get_installation_token
+from app.idempotency import forget_pr
+from app.resilience import call
+from app.tracing import traced
 
 
 def extract_pr_context(payload: dict):
@@ -19,6 +22,7 @@ def extract_pr_context(payload: dict):
     }
 
 
+@traced("github.pr_mergeable")
 def pr_mergeable(token, owner, repo, pr_number):
     url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}"
 
@@ -27,11 +31,12 @@ def pr_mergeable(token, owner, repo, pr_number):
         "Accept": "application/vnd.github+json",
     }
 
-    res = requests.get(url, headers=headers)
+    res = call("github", "GET", url, headers=headers, timeout=10, hedge=True)
     res.raise_for_status()
 
     return res.json()["mergeable"] is True
 
+@traced("github.merge_pr")
 def merge_pr(token, owner, repo, pr_number):
     url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/merge"
 
@@ -44,9 +49,10 @@ def merge_pr(token, owner, repo, pr_number):
         "merge_method": "squash"
     }
 
-    res = requests.put(url, headers=headers, json=payload)
+    res = call("github", "PUT", url, headers=headers, json=payload, timeout=10)
     res.raise_for_status()
 
+@traced("github.resolve_pr")
 def resolve_pr_number(token, owner, repo, sha):
     url = f"https://api.github.com/repos/{owner}/{repo}/commits/{sha}/pulls"
 
@@ -55,7 +61,7 @@ def resolve_pr_number(token, owner, repo, sha):
         "Accept": "application/vnd.github+json",
     }
 
-    res = requests.get(url, headers=headers)
+    res = call("github", "GET", url, headers=headers, timeout=10, hedge=True)
     res.raise_for_status()
 
     prs = res.json()
@@ -64,7 +70,8 @@ def resolve_pr_number(token, owner, repo, sha):
 
     return prs[0]["number"]
 
-async def try_merge_pr(payload: dict):
+@traced("merge")
+def try_merge_pr(payload: dict):
     ctx = extract_pr_context(payload)
 
     if not ctx:
@@ -105,3 +112,8 @@ async def try_merge_pr(payload: dict):
         ctx["repo"],
         pr_number,
     )
+
+    forget_pr(ctx["repo"], pr_number)
+    if blob_store:
+        release_pr_blobs(ctx["repo"], pr_number, merged=True)
+        blob_store.schedule_gc()
@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel
 
 class InitRequest(BaseModel):
@@ -12,6 +13,19 @@ class PublishResponse(BaseModel):
     pr_url: str
     message: str
 
+class ManifestEntry(BaseModel):
+    path: str
+    size: int
+    sha256: str
+
+class PublishManifestRequest(BaseModel):
+    experiment_name: str
+    files: List[ManifestEntry]
+
+class PublishManifestResponse(BaseModel):
+    session_id: str
+    missing: List[str]
+
 class OnboardRequest(BaseModel):
     github_username: str
     
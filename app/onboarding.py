@@ -1,9 +1,11 @@
-
 import json
+import os
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterator
 from github import GithubException
-from .config import org
+from .cache import cache
+from .config import GITHUB_ORG, org
 
 ONBOARDING_DB = Path("data/onboarding.json")
 ONBOARDING_DB.parent.mkdir(exist_ok=True)
@@ -14,13 +16,33 @@ def load_onboarding() -> Dict[str, dict]:
     return {}
 
 def save_onboarding(data: Dict[str, dict]):
-    ONBOARDING_DB.write_text(json.dumps(data, indent=2))
+    tmp_path = ONBOARDING_DB.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2))
+    os.replace(tmp_path, ONBOARDING_DB)
 
-def is_org_member_by_username(github_username: str) -> bool:
+@contextmanager
+def onboarding_transaction() -> Iterator[Dict[str, dict]]:
+    """
+    Read-modify-write of the onboarding file under the cache lock, so
+    concurrent requests (and workers, with a shared cache) don't lose updates.
+    """
+    with cache.exclusive("onboarding"):
+        data = load_onboarding()
+        yield data
+        save_onboarding(data)
+
+def _fetch_org_members() -> list:
+    members = []
     for member in org.get_members():
         try:
-            if member.login and member.login == github_username:
-                return True
+            if member.login:
+                members.append(member.login)
         except GithubException:
             pass
-    return False
+    return members
+
+def is_org_member_by_username(github_username: str) -> bool:
+    members = cache.get_or_load(
+        "org_members", GITHUB_ORG, _fetch_org_members, ttl=60, max_stale=600
+    )
+    return github_username in members
@@ -1,80 +1,202 @@
 from datetime import datetime
+import hashlib
 from pathlib import Path
 import shutil
 import tempfile
-from typing import List
-from fastapi import UploadFile
+from typing import Awaitable, Callable, Dict, List, Optional
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
 
 from .models import PublishResponse
 
-from .utils import compute_experiment_hash, run_git
+from .blobstore import blob_store
+from .idempotency import find_open_proposal, proposal_lock, record_proposal
+
+from .git_backend import git_backend
+from .utils import compute_upload_digest, safe_relative_path
 
 from .config import GITHUB_ORG, get_github_client_for_user, get_user_org
 
+from .tracing import span, traced
+
 from .templates.pr_template import pr_title_template, pr_doc_template
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def hash_upload(file: UploadFile) -> str:
+    """
+    Stream an uploaded file through sha256 and rewind it for writing.
+    """
+    h = hashlib.sha256()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        h.update(chunk)
+    await file.seek(0)
+    return h.hexdigest()
+
+
+def write_upload(file: UploadFile, dest: Path) -> None:
+    """
+    Copy a rewound upload to `dest`. Blocks; run it in the threadpool.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with dest.open("wb") as out:
+        shutil.copyfileobj(file.file, out, UPLOAD_CHUNK_SIZE)
+
 
 async def publish_experiment_backend(
     experiment_name: str,
     files: List[UploadFile],
     github_username: str,
-    user_id: str
+    user_id: str,
+    idempotency_key: Optional[str] = None,
 ):
- 
+
     repo_name = f"{github_username}-{experiment_name}"
-    repo_url = f"https://github.com/{GITHUB_ORG}/{repo_name}.git"
-    tmp_dir = Path(tempfile.mkdtemp(prefix="heda-publish-"))
 
     try:
-        # 1. Clone repo
-        run_git(["git", "clone", repo_url, str(tmp_dir)], cwd=Path("/"))
-
-        # 2. Write uploaded files
-        for file in files:
-            dest = tmp_dir / file.filename
-            dest.parent.mkdir(parents=True, exist_ok=True)
-            dest.write_bytes(await file.read())
-
-        # 3. Compute proposal hash (NOT final)
-        tracked_files = [
-            p for p in tmp_dir.rglob("*")
-            if p.is_file() and ".git" not in p.parts
-        ]
-        proposal_hash = compute_experiment_hash(tracked_files)[:8]
-
-        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
-        branch_name = f"publish/{timestamp}-{proposal_hash}"
-
-        # 4. Create branch
-        run_git(["git", "checkout", "-b", branch_name], cwd=tmp_dir)
-
-        # 5. Commit
-        run_git(["git", "add", "."], cwd=tmp_dir)
-        run_git(
-            ["git", "commit", "-m", f"Propose experiment ({proposal_hash})"],
-            cwd=tmp_dir
+        paths = [str(safe_relative_path(file.filename or "")) for file in files]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Proposal hash comes from the upload alone, before touching git
+    with span("upload.hash"):
+        digests = [(path, await hash_upload(file)) for path, file in zip(paths, files)]
+    proposal_digest = compute_upload_digest(digests)
+
+    def write_files_sync(tmp_dir: Path) -> Dict[str, str]:
+        for path, file in zip(paths, files):
+            write_upload(file, tmp_dir / path)
+        return dict(digests)
+
+    async def write_files(tmp_dir: Path) -> Dict[str, str]:
+        return await run_in_threadpool(write_files_sync, tmp_dir)
+
+    return await open_proposal(
+        repo_name,
+        proposal_digest,
+        write_files,
+        github_username,
+        user_id,
+        idempotency_key,
+    )
+
+
+def _commit_and_open_pr(
+    repo_name: str,
+    tmp_dir: Path,
+    branch_name: str,
+    written: Dict[str, str],
+    proposal_hash: str,
+    user_id: str,
+):
+    # Large files go to the blob store, the commit gets pointers
+    if blob_store:
+        with span("blobstore.externalize"):
+            blob_store.externalize(repo_name, branch_name, tmp_dir, written)
+
+    try:
+        # 3. Commit written paths on a new branch
+        git_backend.commit(
+            tmp_dir,
+            branch_name,
+            written,
+            f"Propose experiment ({proposal_hash})",
         )
 
-        # 6. Push branch
-        run_git(["git", "push", "-u", "origin", branch_name], cwd=tmp_dir)
-        
+        # 4. Push branch
+        git_backend.push(tmp_dir, branch_name)
+
+        # 5. Open the PR as the user
         gh = get_github_client_for_user(user_id)
-        
-        org = gh.get_organization(GITHUB_ORG)
-        
-        repo = org.get_repo(repo_name)
-        pr = repo.create_pull(
-            title=pr_title_template.format(proposal_hash=proposal_hash),
-            body=(pr_doc_template.format(proposal_hash=proposal_hash, branch_name=branch_name)),
-            head=branch_name,
-            base="main",
-        )
 
-        return PublishResponse(
-            experiment_id=proposal_hash,
-            pr_url=pr.html_url,
-            message="Pull request created",
+        with span("github.create_pull"):
+            org = gh.get_organization(GITHUB_ORG)
+
+            repo = org.get_repo(repo_name)
+            pr = repo.create_pull(
+                title=pr_title_template.format(proposal_hash=proposal_hash),
+                body=(pr_doc_template.format(proposal_hash=proposal_hash, branch_name=branch_name)),
+                head=branch_name,
+                base="main",
+            )
+    except BaseException:
+        # No PR will ever release the branch's blob references
+        if blob_store:
+            blob_store.release_ref(repo_name, branch_name)
+        raise
+
+    if blob_store:
+        blob_store.attach_pr(repo_name, branch_name, pr.number)
+    return pr
+
+
+@traced("publish")
+async def open_proposal(
+    repo_name: str,
+    proposal_digest: str,
+    populate: Callable[[Path], Awaitable[Dict[str, str]]],
+    github_username: str,
+    user_id: str,
+    idempotency_key: Optional[str] = None,
+    clone_reference: Optional[Path] = None,
+) -> PublishResponse:
+    """
+    Open a PR proposing the experiment files written by `populate` on top of
+    the current main branch; `populate` returns {path: sha256} of what it
+    wrote. Duplicate proposals return the already open PR.
+    `clone_reference` is a local clone of the repo to borrow objects from.
+    """
+    async with proposal_lock(repo_name, proposal_digest):
+        existing = await run_in_threadpool(
+            find_open_proposal, repo_name, proposal_digest, github_username, idempotency_key
         )
+        if existing:
+            return existing
+
+        repo_url = f"https://github.com/{GITHUB_ORG}/{repo_name}.git"
+        tmp_dir = Path(tempfile.mkdtemp(prefix="heda-publish-"))
+        proposal_hash = proposal_digest[:8]
+
+        try:
+            # 1. Clone repo
+            await run_in_threadpool(
+                git_backend.clone, repo_url, tmp_dir, reference=clone_reference
+            )
+
+            # 2. Write proposed files
+            with span("write"):
+                written = await populate(tmp_dir)
+
+            timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+            branch_name = f"publish/{timestamp}-{proposal_hash}"
+
+            # Commit, push and PR creation block; keep them off the event loop
+            pr = await run_in_threadpool(
+                _commit_and_open_pr,
+                repo_name,
+                tmp_dir,
+                branch_name,
+                written,
+                proposal_hash,
+                user_id,
+            )
+
+            response = PublishResponse(
+                experiment_id=proposal_hash,
+                pr_url=pr.html_url,
+                message="Pull request created",
+            )
+            await run_in_threadpool(
+                record_proposal,
+                repo_name,
+                proposal_digest,
+                github_username,
+                pr.number,
+                response,
+                idempotency_key,
+            )
+            return response
 
-    finally:
-        shutil.rmtree(tmp_dir, ignore_errors=True)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
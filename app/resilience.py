@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+import requests
+from fastapi import HTTPException, Request
+
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDA_HEDGE_DELAY_SECONDS", "0.5"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("HEDA_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_SECONDS = float(os.getenv("HEDA_BREAKER_RECOVERY_SECONDS", "30"))
+
+# Monotonic deadline of the incoming request, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("heda_deadline", default=None)
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="heda-outbound")
+
+
+class DependencyUnavailable(HTTPException):
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"{dependency} is unavailable, retry later",
+            headers={"Retry-After": str(max(1, int(retry_after)))},
+        )
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=504, detail="Request deadline exceeded")
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures and rejects calls until the recovery
+    timeout passes; then lets a single probe through (half-open).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        recovery_seconds: float = BREAKER_RECOVERY_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.recovery_seconds:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return
+            retry_after = self.recovery_seconds - (time.monotonic() - self._opened_at)
+        raise DependencyUnavailable(self.name, retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release(self) -> None:
+        """
+        End a call that says nothing about the dependency's health.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+BREAKERS: Dict[str, CircuitBreaker] = {
+    "auth0": CircuitBreaker("auth0"),
+    "github": CircuitBreaker("github"),
+}
+
+_sessions = threading.local()
+
+
+def _session() -> requests.Session:
+    # Sessions are not thread safe; one per thread keeps connections warm
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+
+def remaining_time() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _timeout(timeout: float) -> float:
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return min(timeout, remaining)
+
+
+def _hedged(send: Callable[[], requests.Response], delay: float) -> requests.Response:
+    """
+    Run `send`; if it has not answered after `delay` (or failed), race a
+    second attempt and return whichever succeeds first.
+    """
+    first = _executor.submit(send)
+    done, _ = wait([first], timeout=delay)
+    if done and first.exception() is None:
+        return first.result()
+
+    pending = {_executor.submit(send)}
+    if not done:
+        pending.add(first)
+
+    error: Optional[BaseException] = first.exception() if done else None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call(
+    dependency: str,
+    method: str,
+    url: str,
+    *,
+    timeout: float = 10,
+    hedge: bool = False,
+    **kwargs,
+) -> requests.Response:
+    """
+    Outbound HTTP call guarded by the dependency's circuit breaker, with the
+    timeout capped by the incoming request's deadline. Idempotent GETs can be
+    hedged. 5xx, 429 and transport errors count as dependency failures; a
+    timeout caused by the deadline raises DeadlineExceeded instead.
+    """
+    request_timeout = _timeout(timeout)
+    breaker = BREAKERS[dependency]
+    breaker.before_call()
+
+    def send() -> requests.Response:
+        return _session().request(method, url, timeout=request_timeout, **kwargs)
+
+    try:
+        if hedge and method == "GET":
+            response = _hedged(send, min(HEDGE_DELAY_SECONDS, request_timeout))
+        else:
+            response = send()
+    except requests.Timeout as e:
+        if request_timeout < timeout:
+            # Cut short by our own deadline, not the dependency's fault
+            breaker.release()
+            raise DeadlineExceeded() from e
+        breaker.record_failure()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+
+    if response.status_code >= 500 or response.status_code == 429:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+@contextmanager
+def without_deadline():
+    """
+    Run outbound calls without the incoming request's deadline, for work
+    that must not be abandoned halfway.
+    """
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+async def deadline_middleware(request: Request, call_next):
+    """
+    Bound outbound calls by the client's X-Request-Timeout (seconds). Without
+    the header a request has no deadline and each call keeps its own timeout.
+    """
+    header = request.headers.get("x-request-timeout")
+    try:
+        budget = float(header) if header is not None else None
+    except ValueError:
+        budget = None
+
+    if budget is None:
+        return await call_next(request)
+
+    token = _deadline.set(time.monotonic() + budget)
+    try:
+        return await call_next(request)
+    finally:
+        _deadline.reset(token)
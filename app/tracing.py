@@ -0,0 +1,155 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from fastapi import Request
+
+TRACING_ENABLED = os.getenv("HEDA_TRACING", "").lower() in ("1", "true", "yes")
+OTEL_ENDPOINT = os.getenv("HEDA_OTEL_ENDPOINT")  # e.g. http://localhost:4318/v1/traces
+
+logger = logging.getLogger("heda.trace")
+if TRACING_ENABLED and not logger.handlers:
+    # One JSON object per line on stderr, whatever the server's logging setup
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_tracer = None
+if TRACING_ENABLED and OTEL_ENDPOINT:
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        _provider = TracerProvider(resource=Resource.create({"service.name": "heda-backend"}))
+        _provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=OTEL_ENDPOINT)))
+        otel_trace.set_tracer_provider(_provider)
+        _tracer = otel_trace.get_tracer("heda")
+    except ImportError:
+        logger.warning("HEDA_OTEL_ENDPOINT is set but opentelemetry is not installed")
+
+# Spans of the current request; None when the request is not traced
+_request_spans: ContextVar[Optional[List[dict]]] = ContextVar("heda_request_spans", default=None)
+
+_METRIC_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, name: str, spans: List[dict]):
+        self.name = name
+        self._spans = spans
+        self._otel = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._otel = _tracer.start_as_current_span(self.name)
+            self._otel.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self._start
+        self._spans.append({
+            "name": self.name,
+            "start": self._start,
+            "dur_ms": round(duration * 1000, 2),
+            "error": exc[0].__name__ if exc[0] else None,
+        })
+        if self._otel is not None:
+            self._otel.__exit__(*exc)
+        return False
+
+
+def span(name: str):
+    """
+    Time a stage of the current request. A shared no-op when tracing is off.
+    """
+    spans = _request_spans.get()
+    if spans is None:
+        return _NOOP_SPAN
+    return _Span(name, spans)
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorator form of `span` for sync and async functions.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def server_timing(spans: List[dict], total_ms: float) -> str:
+    entries = [
+        f"{_METRIC_NAME_RE.sub('_', s['name'])};dur={s['dur_ms']}"
+        for s in sorted(spans, key=lambda s: s["start"])
+    ]
+    entries.append(f"total;dur={round(total_ms, 2)}")
+    return ", ".join(entries)
+
+
+async def tracing_middleware(request: Request, call_next):
+    """
+    Collect request spans into a Server-Timing header and a JSON log line.
+    Only installed when HEDA_TRACING is enabled.
+    """
+    spans: List[dict] = []
+    token = _request_spans.set(spans)
+    start = time.perf_counter()
+    status_code = 500
+
+    try:
+        with span("request"):
+            response = await call_next(request)
+        status_code = response.status_code
+        total_ms = (time.perf_counter() - start) * 1000
+        stages = [s for s in spans if s["name"] != "request"]
+        response.headers["Server-Timing"] = server_timing(stages, total_ms)
+        return response
+    finally:
+        _request_spans.reset(token)
+        logger.info(json.dumps({
+            "event": "request_trace",
+            "method": request.method,
+            "path": request.url.path,
+            "status": status_code,
+            "total_ms": round((time.perf_counter() - start) * 1000, 2),
+            "spans": [
+                {k: v for k, v in s.items() if k != "start"}
+                | {"offset_ms": round((s["start"] - start) * 1000, 2)}
+                for s in sorted(spans, key=lambda s: s["start"])
+            ],
+        }))
@@ -1,26 +1,48 @@
 import hashlib
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 import subprocess
-from typing import List
+from typing import Iterable, List, Tuple
 
 import hmac
 
 from app.config import GITHUB_WEBHOOK_SECRET
+from app.tracing import span
 
 
-def compute_experiment_hash(files: List[Path]) -> str:
+def compute_upload_digest(entries: Iterable[Tuple[str, str]]) -> str:
     """
-    Deterministic hash across file paths + contents
+    Deterministic hash across (relative path, sha256 of content) pairs.
+    Depends only on what was uploaded, so retries map to the same digest.
     """
     h = hashlib.sha256()
-    for f in sorted(files, key=lambda p: str(p)):
-        h.update(str(f.relative_to(f.parents[len(f.parents) - 2])).encode())
-        h.update(f.read_bytes())
+    for path, digest in sorted(entries):
+        h.update(path.encode())
+        h.update(b"\0")
+        h.update(digest.encode())
+        h.update(b"\n")
     return h.hexdigest()
 
 
-def run_git(cmd: List[str], cwd: Path):
-    subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+def run_git(cmd: List[str], cwd: Path) -> str:
+    with span(f"git.{cmd[1]}"):
+        result = subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.stdout.decode()
+
+
+def safe_relative_path(path: str) -> PurePosixPath:
+    """
+    Validate a client supplied path and return it relative to the work tree.
+    Raises ValueError on absolute paths, traversal or the .git directory.
+    """
+    rel = PurePosixPath(path.replace("\\", "/"))
+    if (
+        not rel.parts
+        or rel.is_absolute()
+        or ".." in rel.parts
+        or rel.parts[0] == ".git"
+    ):
+        raise ValueError(f"Invalid path: {path}")
+    return rel
 
 
 def verify_signature(payload: bytes, signature: str):
@@ -0,0 +1,113 @@
+import inspect
+import json
+import re
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import orjson
+except ImportError:  # optional, faster payload parsing
+    orjson = None
+
+from .blobstore import blob_store
+from .cache import cache
+from .config import GITHUB_ORG
+from .delta import release_pr_blobs
+from .idempotency import forget_pr
+from .merge import try_merge_pr
+
+# GitHub sends compact JSON with "action" as the first key
+_ACTION_RE = re.compile(rb'^\s*\{\s*"action"\s*:\s*"([^"]*)"')
+
+Handler = Callable[[dict], object]
+
+
+class _Registration(NamedTuple):
+    action: Optional[str]  # None matches any action
+    requires: Tuple[bytes, ...]
+    handler: Handler
+
+
+_handlers: Dict[str, List[_Registration]] = defaultdict(list)
+
+
+def on(event: str, action: Optional[str] = None, requires: Sequence[bytes] = ()):
+    """
+    Register a webhook handler for an event (and optionally an action).
+    `requires` are byte strings that must all appear in the raw body; events
+    missing any of them are acknowledged without being parsed.
+    """
+    def decorator(handler: Handler) -> Handler:
+        _handlers[event].append(_Registration(action, tuple(requires), handler))
+        return handler
+    return decorator
+
+
+def _parse(body: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _matches(registration: _Registration, action: Optional[str]) -> bool:
+    return registration.action is None or registration.action == action
+
+
+async def dispatch_webhook(event: Optional[str], body: bytes) -> int:
+    """
+    Route a verified webhook delivery to its handlers. Irrelevant events are
+    acknowledged without decoding JSON; relevant ones are parsed once.
+    Returns the number of handlers run.
+    """
+    registrations = _handlers.get(event)
+    if not registrations:
+        return 0
+
+    match = _ACTION_RE.match(body[:128])
+    candidates = [
+        r for r in registrations
+        if (match is None or _matches(r, match.group(1).decode()))
+        and all(marker in body for marker in r.requires)
+    ]
+    if not candidates:
+        return 0
+
+    payload = _parse(body)
+    action = payload.get("action")
+    ran = 0
+    for registration in candidates:
+        if not _matches(registration, action):
+            continue
+        if inspect.iscoroutinefunction(registration.handler):
+            await registration.handler(payload)
+        else:
+            await run_in_threadpool(registration.handler, payload)
+        ran += 1
+    return ran
+
+
+@on("check_run", "completed", requires=(b'"verify"', b'"success"'))
+def on_check_run_completed(payload: dict):
+    check_run = payload["check_run"]
+    if check_run["name"] == "verify" and check_run["conclusion"] == "success":
+        try_merge_pr(payload)
+
+
+@on("pull_request", "closed")
+def on_pull_request_closed(payload: dict):
+    repo_name = payload["repository"]["name"]
+    pr = payload["pull_request"]
+
+    forget_pr(repo_name, pr["number"])
+    if blob_store:
+        release_pr_blobs(repo_name, pr["number"], merged=bool(pr.get("merged")))
+        blob_store.schedule_gc()
+
+
+@on("organization", "member_added")
+def on_member_added(payload: dict):
+    # Let /onboard/status see the new member without waiting for the TTL
+    cache.delete("org_members", GITHUB_ORG)
+    cache.delete("membership", payload["membership"]["user"]["login"])
@@ -1,22 +1,44 @@
 from datetime import datetime
-from typing import Dict, List
+from subprocess import CalledProcessError
+from typing import Dict, List, Optional
 from fastapi import Depends, FastAPI, File, Form, HTTPException, Header, Request, UploadFile
+from fastapi.responses import StreamingResponse
 
 from app.constants import InvitationStatus
 
-from app.merge import try_merge_pr
-from app.onboarding import is_org_member_by_username, load_onboarding, save_onboarding
+from app.admission import admission_controller, admission_middleware
+from app.archive import publish_archive_backend
+from app.blobstore import SHA256_RE, blob_store, parse_range
+from app.cache import cache
+from app.delta import create_session, publish_delta_backend
+from app.onboarding import is_org_member_by_username, load_onboarding, onboarding_transaction
 from app.publishing import publish_experiment_backend
 
 from app.auth import check_github_org_membership, get_current_user
 from app.github_utils import create_gitops_repo, initialize_local_repo
-from app.models import InitRequest, InitResponse, OnboardStatusResponse, PublishResponse
+from app.models import (
+    InitRequest,
+    InitResponse,
+    OnboardStatusResponse,
+    PublishManifestRequest,
+    PublishManifestResponse,
+    PublishResponse,
+)
 from app.config import gh, org
+from app.resilience import deadline_middleware
+from app.tracing import TRACING_ENABLED, tracing_middleware
 from app.utils import verify_signature
+from app.webhooks import dispatch_webhook
 from github import GithubException
 
 app = FastAPI(title="HEDA GitOps Backend")
 
+# Added first so it runs innermost and can lift the deadline for heavy routes
+app.middleware("http")(admission_middleware)
+app.middleware("http")(deadline_middleware)
+if TRACING_ENABLED:
+    app.middleware("http")(tracing_middleware)
+
 @app.post("/init", response_model=InitResponse)
 def init_experiment(
     request: InitRequest,
@@ -52,6 +74,7 @@ def init_experiment(
 async def publish_experiment(
     experiment_name: str = Form(...),
     files: List[UploadFile] = File(...),
+    idempotency_key: Optional[str] = Header(None),
     user: dict = Depends(get_current_user)
 ):
     github_username = user["nickname"]
@@ -59,7 +82,133 @@ async def publish_experiment(
     
     # check_github_org_membership(github_username)
 
-    return await publish_experiment_backend(experiment_name, files, github_username, user_id)
+    return await publish_experiment_backend(
+        experiment_name, files, github_username, user_id, idempotency_key
+    )
+
+
+@app.post("/publish/archive", response_model=PublishResponse)
+async def publish_archive(
+    request: Request,
+    experiment_name: str,
+    content_type: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Publish a whole experiment sent as one tar (optionally gzip/zstd) or zip
+    request body, extracted while it streams in.
+    """
+    github_username = user["nickname"]
+    user_id = user["user_id"]
+
+    return await publish_archive_backend(
+        experiment_name,
+        content_type,
+        request.stream(),
+        github_username,
+        user_id,
+        idempotency_key,
+    )
+
+
+@app.post("/publish/manifest", response_model=PublishManifestResponse)
+def publish_manifest(
+    request: PublishManifestRequest,
+    user: Dict = Depends(get_current_user)
+):
+    """
+    Delta publish, phase 1: returns the digests the client still has to upload.
+    """
+    github_username = user["nickname"]
+    repo_name = f"{github_username}-{request.experiment_name}"
+
+    try:
+        return create_session(repo_name, github_username, request.files)
+    except CalledProcessError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Failed to read main of '{repo_name}': {e.stderr.decode().strip()}",
+        )
+
+
+@app.post("/publish/delta", response_model=PublishResponse)
+async def publish_delta(
+    session_id: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    idempotency_key: Optional[str] = Header(None),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Delta publish, phase 2: upload the missing blobs and open the PR.
+    """
+    github_username = user["nickname"]
+    user_id = user["user_id"]
+
+    return await publish_delta_backend(
+        session_id, files or [], github_username, user_id, idempotency_key
+    )
+
+
+@app.get("/blobs/{sha256}")
+def get_blob(
+    sha256: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    user: Dict = Depends(get_current_user)
+):
+    """
+    Serve large experiment files kept out of git, with single-range reads.
+    """
+    if blob_store is None or not SHA256_RE.match(sha256) or not blob_store.has(sha256):
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    size = blob_store.object_path(sha256).stat().st_size
+    headers = {"Accept-Ranges": "bytes", "ETag": f'"{sha256}"'}
+
+    byte_range = None
+    if range_header:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            raise HTTPException(
+                status_code=416,
+                detail="Requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{size}"},
+            )
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            blob_store.open_range(sha256),
+            media_type="application/octet-stream",
+            headers=headers,
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blob_store.open_range(sha256, start, end),
+        status_code=206,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
+
+
+@app.get("/admission/stats")
+def admission_stats(user: Dict = Depends(get_current_user)):
+    """
+    Queue length, wait times and disk reservations of the heavy routes.
+    """
+    return admission_controller.stats(user["nickname"])
+
+
+@app.get("/cache/stats")
+def cache_stats(user: Dict = Depends(get_current_user)):
+    """
+    Hit/miss/load counters of the shared cache per namespace.
+    """
+    return cache.stats()
 
 
 @app.post("/onboard")
@@ -91,12 +240,12 @@ def onboard_user(user: Dict = Depends(get_current_user)):
             detail=f"Failed to invite user: {e.data}"
         )
 
-    onboarding[github_username] = {
-        "github_username": github_username,
-        "invited_at": datetime.utcnow().isoformat() + "Z",
-        "onboarded": False,
-    }
-    save_onboarding(onboarding)
+    with onboarding_transaction() as onboarding:
+        onboarding[github_username] = {
+            "github_username": github_username,
+            "invited_at": datetime.utcnow().isoformat() + "Z",
+            "onboarded": False,
+        }
 
     return {"message": "Invitation sent"}
 
@@ -115,21 +264,16 @@ def onboarding_status(
 
     record = onboarding[github_username]
 
-      # Check GitHub org membership
-    if is_org_member_by_username(record["github_username"]):
-        record["onboarded"] = True
-        record.update({
-            "onboarded": True,
-        })
-        save_onboarding(onboarding)
+    # Check GitHub org membership
+    onboarded = is_org_member_by_username(record["github_username"])
+
+    if record.get("onboarded") != onboarded:
+        with onboarding_transaction() as onboarding:
+            onboarding[github_username]["onboarded"] = onboarded
+
+    if onboarded:
         return OnboardStatusResponse(onboarded=True, invitation=InvitationStatus.accepted)
 
-    record["onboarded"] = False
-    record.update({
-        "onboarded": False,
-    })
-    save_onboarding(onboarding)
-        
     return OnboardStatusResponse(onboarded=False, invitation=InvitationStatus.pending)
 
 @app.post("/github/webhook")
@@ -141,14 +285,7 @@ async def github_webhook(
     payload = await request.body()
     verify_signature(payload, x_hub_signature_256)
 
-    data = await request.json()
-
-    if (
-    x_github_event == "check_run"
-    and data["action"] == "completed"
-    and data["check_run"]["name"] == "verify"
-    and data["check_run"]["conclusion"] == "success"):
-        await try_merge_pr(data)
-
+    # Handlers are registered per (event, action) in app.webhooks
+    await dispatch_webhook(x_github_event, payload)
 
     return {"status": "ok"}
@@ -0,0 +1,18 @@
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# app.config talks to GitHub at import time; the tests run offline against a
+# stand-in with the same names.
+config = types.ModuleType("app.config")
+config.GITHUB_ORG = "heda-test"
+config.ADMIN_GITHUB_TOKEN = "test-admin-token"
+config.GITHUB_APP_ID = "1"
+config.GITHUB_WEBHOOK_SECRET = "test-webhook-secret"
+config.GITHUB_PRIVATE_KEY_PATH = None
+config.gh = None
+config.org = None
+config.get_user_gh = config.get_user_org = config.get_github_client_for_user = None
+sys.modules.setdefault("app.config", config)
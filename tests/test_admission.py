@@ -0,0 +1,181 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app import admission
+from app.admission import JOB_BASE_BYTES, AdmissionController
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(**values):
+        for name, value in values.items():
+            monkeypatch.setattr(admission, name, value)
+    return set_limits
+
+
+@pytest.fixture
+def controller(monkeypatch) -> AdmissionController:
+    controller = AdmissionController()
+    monkeypatch.setattr(admission, "admission_controller", controller)
+    return controller
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_per_user_cap_does_not_block_others(limits, controller):
+    limits(MAX_CONCURRENT_JOBS=3, MAX_CONCURRENT_JOBS_PER_USER=1)
+
+    async def scenario():
+        first = await controller.acquire("alice", 0)
+        second = asyncio.ensure_future(controller.acquire("alice", 0))
+        await settle()
+        assert not second.done()
+
+        bob = await asyncio.wait_for(controller.acquire("bob", 0), 1)
+        assert controller.stats("alice")["my_queued"] == 1
+
+        controller.release(first)
+        controller.release(await asyncio.wait_for(second, 1))
+        controller.release(bob)
+
+    asyncio.run(scenario())
+    assert controller.stats("alice")["running"] == 0
+    assert controller.stats("alice")["disk_reserved_bytes"] == 0
+
+
+def test_weighted_fair_queuing(limits, controller):
+    limits(MAX_CONCURRENT_JOBS=1, USER_WEIGHTS={"carol": 2.0})
+    order = []
+
+    async def job(user):
+        ticket = await controller.acquire(user, 0)
+        order.append(user)
+        await asyncio.sleep(0)
+        controller.release(ticket)
+
+    async def scenario():
+        blocker = await controller.acquire("alice", 0)
+        # A bulk uploader queues first, then two light users show up
+        jobs = [asyncio.ensure_future(job("alice")) for _ in range(3)]
+        await settle()
+        jobs += [asyncio.ensure_future(job("bob")), asyncio.ensure_future(job("carol"))]
+        await settle()
+        controller.release(blocker)
+        await asyncio.wait_for(asyncio.gather(*jobs), 1)
+
+    asyncio.run(scenario())
+    # Neither light user waits behind the whole bulk backlog; the heavier
+    # weight goes first
+    assert order == ["carol", "alice", "bob", "alice", "alice"]
+
+
+def test_rejections_carry_retry_after(limits, controller):
+    limits(
+        MAX_CONCURRENT_JOBS=1,
+        MAX_QUEUED_JOBS_PER_USER=1,
+        TEMP_DISK_BUDGET_BYTES=3 * JOB_BASE_BYTES,
+    )
+
+    async def scenario():
+        running = await controller.acquire("alice", 0)
+        queued = asyncio.ensure_future(controller.acquire("alice", 0))
+        await settle()
+
+        with pytest.raises(HTTPException) as exc:
+            await controller.acquire("alice", 0)
+        assert exc.value.status_code == 429
+        assert int(exc.value.headers["Retry-After"]) >= 1
+
+        with pytest.raises(HTTPException) as exc:
+            await controller.acquire("bob", JOB_BASE_BYTES)
+        assert exc.value.status_code == 429
+        assert "disk budget" in exc.value.detail
+
+        with pytest.raises(HTTPException) as exc:
+            await controller.acquire("bob", 3 * JOB_BASE_BYTES)
+        assert exc.value.status_code == 413
+
+        controller.release(running)
+        controller.release(await queued)
+
+    asyncio.run(scenario())
+    assert controller.stats("alice")["rejected"] == 2
+
+
+def test_queue_timeout_withdraws_ticket(limits, controller):
+    limits(MAX_CONCURRENT_JOBS=1, MAX_QUEUE_WAIT_SECONDS=0.05)
+
+    async def scenario():
+        running = await controller.acquire("alice", 0)
+        with pytest.raises(HTTPException) as exc:
+            await controller.acquire("bob", 10)
+        assert exc.value.status_code == 429
+        assert controller.stats("bob")["queued"] == 0
+        controller.release(running)
+
+    asyncio.run(scenario())
+    assert controller.stats("bob")["disk_reserved_bytes"] == 0
+
+
+def test_client_leaving_the_queue_gives_its_slot_back(limits, controller):
+    limits(MAX_CONCURRENT_JOBS=1)
+
+    async def scenario():
+        running = await controller.acquire("alice", 0)
+        tags_before = dict(controller._last_finish)
+
+        queued = [asyncio.ensure_future(controller.acquire("bob", 10)) for _ in range(2)]
+        await settle()
+        first_tag = controller._queues["bob"][1].finish_tag
+
+        queued[0].cancel()
+        await settle()
+        assert controller.stats("bob")["my_queued"] == 1
+        # The remaining ticket takes the withdrawn one's place
+        assert controller._queues["bob"][0].finish_tag < first_tag
+
+        queued[1].cancel()
+        await settle()
+        assert controller._last_finish.get("bob", 0.0) <= tags_before.get("alice", 0.0)
+        assert controller.stats("bob")["disk_reserved_bytes"] == JOB_BASE_BYTES
+
+        controller.release(running)
+
+    asyncio.run(scenario())
+    assert controller.stats("bob")["queued"] == 0
+    assert controller.stats("bob")["disk_reserved_bytes"] == 0
+
+
+@pytest.fixture
+def client(monkeypatch, controller):
+    monkeypatch.setattr(admission, "get_current_user", lambda authorization: {"nickname": "alice"})
+
+    app = FastAPI()
+    app.middleware("http")(admission.admission_middleware)
+
+    @app.post("/publish/archive")
+    async def publish_archive():
+        return controller.stats("alice")
+
+    return TestClient(app)
+
+
+def test_middleware_reserves_declared_length(client):
+    stats = client.post("/publish/archive", content=b"x" * 1000).json()
+    assert stats["disk_reserved_bytes"] == JOB_BASE_BYTES + 1000
+
+
+def test_middleware_reserves_maximum_for_chunked_bodies(client):
+    stats = client.post("/publish/archive", content=iter([b"x" * 1000])).json()
+    assert stats["disk_reserved_bytes"] == JOB_BASE_BYTES + admission.MAX_ARCHIVE_BYTES
+
+
+def test_middleware_rejects_bad_length(client):
+    response = client.post("/publish/archive", headers={"Content-Length": "-1"})
+    assert response.status_code == 400
@@ -0,0 +1,129 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+from app import archive
+from app.archive import extract_archive
+
+
+def tar_bytes(*members, mode: str = "w") -> bytes:
+    """
+    Build a tar from (name, data) pairs or prepared TarInfo objects.
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tar:
+        for member in members:
+            if isinstance(member, tarfile.TarInfo):
+                tar.addfile(member)
+            else:
+                name, data = member
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def zip_bytes(*members) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive_file:
+        for member in members:
+            if isinstance(member, zipfile.ZipInfo):
+                archive_file.writestr(member, b"target")
+            else:
+                archive_file.writestr(*member)
+    return buf.getvalue()
+
+
+def extract(data: bytes, archive_format: str, dest):
+    return extract_archive(io.BytesIO(data), archive_format, dest)
+
+
+def rejected(data: bytes, archive_format: str, dest) -> HTTPException:
+    with pytest.raises(HTTPException) as exc:
+        extract(data, archive_format, dest)
+    return exc.value
+
+
+def test_extracts_and_hashes(tmp_path):
+    data = tar_bytes(("data/run.csv", b"a,b\n"), ("README.md", b"hi\n"), mode="w:gz")
+    digests = extract(data, "tar.gz", tmp_path)
+
+    assert sorted(digests) == ["README.md", "data/run.csv"]
+    assert (tmp_path / "data" / "run.csv").read_bytes() == b"a,b\n"
+
+
+@pytest.mark.parametrize("name", ["../escape.txt", "/etc/passwd", "data/../../escape.txt", ".git/config"])
+@pytest.mark.parametrize("archive_format", ["tar", "zip"])
+def test_rejects_traversal(tmp_path, name, archive_format):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    data = tar_bytes((name, b"x")) if archive_format == "tar" else zip_bytes((name, b"x"))
+
+    assert rejected(data, archive_format, dest).status_code == 400
+    assert not (tmp_path / "escape.txt").exists()
+
+
+@pytest.mark.parametrize("kind", [tarfile.SYMTYPE, tarfile.LNKTYPE])
+def test_rejects_tar_links(tmp_path, kind):
+    link = tarfile.TarInfo("link")
+    link.type = kind
+    link.linkname = "/etc/passwd"
+
+    error = rejected(tar_bytes(link), "tar", tmp_path)
+    assert error.status_code == 400
+    assert "entry type" in error.detail
+
+
+def test_rejects_zip_symlinks(tmp_path):
+    link = zipfile.ZipInfo("link")
+    link.external_attr = 0o120777 << 16
+
+    assert rejected(zip_bytes(link), "zip", tmp_path).status_code == 400
+
+
+@pytest.mark.parametrize("order", [["a", "a/b"], ["a/b", "a"]])
+def test_rejects_file_directory_conflicts(tmp_path, order):
+    data = tar_bytes(*[(name, b"x") for name in order])
+
+    error = rejected(data, "tar", tmp_path)
+    assert error.status_code == 400
+    assert "file and a directory" in error.detail
+
+
+def test_entry_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "MAX_ARCHIVE_ENTRIES", 2)
+    data = tar_bytes(*[(f"f{i}", b"x") for i in range(3)])
+
+    assert rejected(data, "tar", tmp_path).status_code == 413
+
+
+def test_expanded_size_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "MAX_ARCHIVE_BYTES", 1000)
+    # Compresses to far less than the limit; the expanded bytes are counted
+    data = tar_bytes(("a", b"\0" * 600), ("b", b"\0" * 600), mode="w:gz")
+    assert len(data) < 1000
+
+    error = rejected(data, "tar.gz", tmp_path)
+    assert error.status_code == 413
+    assert "expands" in error.detail
+
+
+def test_zip_spool_limit(tmp_path, monkeypatch):
+    data = zip_bytes(("a", b"\0" * 10))
+    monkeypatch.setattr(archive, "MAX_ARCHIVE_BYTES", len(data) - 1)
+
+    error = rejected(data, "zip", tmp_path)
+    assert error.status_code == 413
+    assert "larger than" in error.detail
+
+
+def test_corrupt_archives_are_client_errors(tmp_path):
+    assert rejected(b"not a tar at all" * 100, "tar.gz", tmp_path).status_code == 400
+    assert rejected(b"PK\x03\x04 truncated", "zip", tmp_path).status_code == 400
+
+
+def test_empty_archive(tmp_path):
+    assert rejected(tar_bytes(), "tar", tmp_path).status_code == 400
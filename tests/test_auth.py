@@ -0,0 +1,60 @@
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from app import auth
+from app.cache import Cache, MemoryBackend
+from app.resilience import DependencyUnavailable
+
+JWKS = {"keys": [{"kid": "k1", "kty": "RSA", "use": "sig", "n": "AQAB", "e": "AQAB"}]}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = Cache(MemoryBackend())
+    monkeypatch.setattr(auth, "cache", cache)
+    cache.set("jwks", auth.AUTH0_DOMAIN, JWKS, ttl=3600)
+    return cache
+
+
+def token_with_kid(kid: str) -> str:
+    return jwt.encode({"sub": "auth0|1"}, "secret", algorithm="HS256", headers={"kid": kid})
+
+
+def test_unknown_kid_keeps_cached_jwks_while_auth0_is_down(cache, monkeypatch):
+    fetches = []
+
+    def auth0_down():
+        fetches.append(1)
+        raise DependencyUnavailable("auth0", 30)
+
+    monkeypatch.setattr(auth, "_fetch_jwks", auth0_down)
+
+    for _ in range(5):
+        with pytest.raises(HTTPException) as exc:
+            auth.verify_token(token_with_kid("made-up"))
+        assert exc.value.status_code == 401
+
+    assert len(fetches) == 1
+    assert auth.get_jwks() == JWKS
+
+
+def test_unknown_kid_refresh_is_rate_limited(cache, monkeypatch):
+    rotated = {"keys": JWKS["keys"] + [dict(JWKS["keys"][0], kid="k2")]}
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return rotated
+
+    monkeypatch.setattr(auth, "_fetch_jwks", fetch)
+
+    # A rotated key is picked up by the first refresh...
+    assert auth._find_rsa_key(auth._refresh_jwks(), "k2")
+    assert auth.get_jwks() == rotated
+
+    # ...and made-up kids cannot trigger more fetches within the interval
+    for _ in range(5):
+        with pytest.raises(HTTPException):
+            auth.verify_token(token_with_kid("made-up"))
+    assert len(fetches) == 1
@@ -0,0 +1,235 @@
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+from app.cache import Cache, MemoryBackend, RedisBackend, SQLiteBackend
+
+
+def wait_for_refresh(cache: Cache) -> None:
+    cache._executor.submit(lambda: None).result()
+    time.sleep(0.05)
+
+
+@pytest.fixture
+def sqlite_path(tmp_path) -> Path:
+    return tmp_path / "cache.sqlite3"
+
+
+@pytest.fixture(params=["memory", "sqlite", "sqlite+local"])
+def cache(request, sqlite_path) -> Cache:
+    if request.param == "memory":
+        return Cache(MemoryBackend())
+    if request.param == "sqlite":
+        return Cache(SQLiteBackend(sqlite_path))
+    return Cache(SQLiteBackend(sqlite_path), local=MemoryBackend())
+
+
+def test_fresh_stale_and_expired(cache, monkeypatch):
+    values = iter(["v1", "v2", "v3"])
+    loader = lambda: next(values)
+    monkeypatch.setattr("app.cache.CACHE_LOCAL_TTL_SECONDS", 0.05)
+
+    assert cache.get_or_load("ns", "k", loader, ttl=0.2, max_stale=0.3) == "v1"
+    assert cache.get_or_load("ns", "k", loader, ttl=0.2, max_stale=0.3) == "v1"
+
+    # Past the TTL: the stale value is served while v2 loads in the background
+    time.sleep(0.25)
+    assert cache.get_or_load("ns", "k", loader, ttl=0.2, max_stale=0.3) == "v1"
+    wait_for_refresh(cache)
+    assert cache.get_or_load("ns", "k", loader, ttl=0.2, max_stale=0.3) == "v2"
+
+    # Past TTL + max_stale: loaded synchronously
+    time.sleep(0.6)
+    assert cache.get_or_load("ns", "k", loader, ttl=0.2, max_stale=0.3) == "v3"
+
+    assert cache.stats()["namespaces"]["ns"] == {
+        "misses": 2, "loads": 2, "hits": 2, "stale_hits": 1, "refreshes": 1,
+    }
+
+
+def test_stale_value_served_while_loader_fails(cache):
+    cache.set("ns", "k", "cached", ttl=0, max_stale=60)
+
+    def failing():
+        raise ConnectionError("dependency down")
+
+    assert cache.get_or_load("ns", "k", failing, ttl=60, max_stale=60) == "cached"
+    wait_for_refresh(cache)
+    assert cache.get_or_load("ns", "k", failing, ttl=60, max_stale=60) == "cached"
+    assert cache.stats()["namespaces"]["ns"]["load_errors"] >= 1
+
+
+def test_delete(cache):
+    cache.set("ns", "k", "v", ttl=60)
+    cache.delete("ns", "k")
+    assert cache.get_or_load("ns", "k", lambda: "reloaded", ttl=60) == "reloaded"
+
+
+def test_lock_excludes_and_times_out(cache):
+    with cache.lock("section") as outer:
+        assert outer
+        with cache.lock("section", timeout=0.1) as inner:
+            assert not inner
+        with pytest.raises(HTTPException) as exc:
+            with cache.exclusive("section", timeout=0.1):
+                pytest.fail("ran without the lock")
+        assert exc.value.status_code == 503
+
+    with cache.exclusive("section", timeout=0.1):
+        pass
+
+
+def test_throttle(cache):
+    assert cache.throttle("refresh", 0.2)
+    assert not cache.throttle("refresh", 0.2)
+    time.sleep(0.25)
+    assert cache.throttle("refresh", 0.2)
+
+
+# --- cross-process behaviour of the SQLite tier ---------------------------
+
+def _critical_section(db_path: str, log_path: str, worker: int) -> None:
+    cache = Cache(SQLiteBackend(Path(db_path)))
+    for _ in range(3):
+        with cache.exclusive("section"):
+            with open(log_path, "a") as log:
+                log.write(f"enter {worker}\n")
+            time.sleep(0.01)
+            with open(log_path, "a") as log:
+                log.write(f"exit {worker}\n")
+
+
+def _load_shared(db_path: str, log_path: str, barrier) -> None:
+    cache = Cache(SQLiteBackend(Path(db_path)), local=MemoryBackend())
+
+    def loader():
+        with open(log_path, "a") as log:
+            log.write("load\n")
+        time.sleep(0.3)
+        return "shared"
+
+    barrier.wait()
+    assert cache.get_or_load("ns", "key", loader, ttl=60) == "shared"
+
+
+FORK = multiprocessing.get_context("fork")
+
+
+def _run_workers(target, args, processes: int = 6) -> None:
+    workers = [FORK.Process(target=target, args=args(i)) for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+
+
+def test_sqlite_lock_is_exclusive_across_processes(sqlite_path, tmp_path):
+    log_path = tmp_path / "log"
+    _run_workers(_critical_section, lambda i: (str(sqlite_path), str(log_path), i))
+
+    lines = log_path.read_text().splitlines()
+    assert len(lines) == 6 * 3 * 2
+    for enter, exit_ in zip(lines[::2], lines[1::2]):
+        assert enter.split()[0] == "enter"
+        assert exit_ == enter.replace("enter", "exit")
+
+
+def test_sqlite_single_flight_across_processes(sqlite_path, tmp_path):
+    log_path = tmp_path / "log"
+    barrier = FORK.Barrier(6)
+    _run_workers(_load_shared, lambda i: (str(sqlite_path), str(log_path), barrier))
+
+    assert log_path.read_text().splitlines() == ["load"]
+
+
+# --- Redis tier against a local server ------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def redis_url():
+    redis = pytest.importorskip("redis")
+    if os.getenv("HEDA_TEST_REDIS_URL"):
+        yield os.environ["HEDA_TEST_REDIS_URL"]
+        return
+    if not shutil.which("redis-server"):
+        pytest.skip("redis-server is not installed")
+
+    port = _free_port()
+    server = subprocess.Popen(
+        ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"redis://127.0.0.1:{port}/0"
+    try:
+        for _ in range(50):
+            try:
+                redis.Redis.from_url(url).ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.1)
+        else:
+            pytest.skip("redis-server did not start")
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+@pytest.fixture
+def redis_cache(redis_url) -> Cache:
+    backend = RedisBackend(redis_url)
+    backend._redis.flushdb()
+    return Cache(backend)
+
+
+def test_redis_expiry_and_lock(redis_cache):
+    redis_cache.set("ns", "k", "v", ttl=0.1, max_stale=0.1)
+    assert redis_cache.get_or_load("ns", "k", lambda: "fresh", ttl=60) == "v"
+    time.sleep(0.3)
+    assert redis_cache.get_or_load("ns", "k", lambda: "fresh", ttl=60) == "fresh"
+
+    with redis_cache.lock("section") as outer:
+        assert outer
+        with redis_cache.lock("section", timeout=0.1) as inner:
+            assert not inner
+
+
+def test_redis_single_flight(redis_url):
+    loads, results = [], []
+    barrier = threading.Barrier(6)
+
+    def worker():
+        # One Cache per thread, as separate workers would have
+        cache = Cache(RedisBackend(redis_url))
+
+        def loader():
+            loads.append(1)
+            time.sleep(0.3)
+            return "shared"
+
+        barrier.wait()
+        results.append(cache.get_or_load("ns", "single-flight", loader, ttl=60))
+
+    RedisBackend(redis_url)._redis.flushdb()
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["shared"] * 6
+    assert len(loads) == 1
@@ -0,0 +1,122 @@
+import hashlib
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app import delta
+from app.blobstore import BlobStore, pointer_text
+from app.models import ManifestEntry
+
+BIG = b"x" * 4096
+BIG_SHA = hashlib.sha256(BIG).hexdigest()
+
+
+def git(*args: str, cwd: Path) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE
+    ).stdout.decode()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch) -> BlobStore:
+    store = BlobStore(tmp_path / "blobs")
+    monkeypatch.setattr(delta, "blob_store", store)
+    for name in ("REPO_CACHE_DIR", "STAGING_DIR", "SESSION_DIR"):
+        path = tmp_path / name.lower()
+        path.mkdir()
+        monkeypatch.setattr(delta, name, path)
+    return store
+
+
+def store_blob(store: BlobStore, tmp_path: Path, repo_name: str, path: str = "big.bin") -> None:
+    work_tree = tmp_path / f"work-{repo_name}"
+    work_tree.mkdir()
+    (work_tree / path).write_bytes(BIG)
+    store.put_file(work_tree / path, BIG_SHA)
+    store.sync_main(repo_name, {path: BIG_SHA})
+
+
+def test_referenced_object_is_scoped_to_repo_and_size(store, tmp_path):
+    store_blob(store, tmp_path, "bob-exp")
+
+    assert store.referenced_object("bob-exp", BIG_SHA, len(BIG)) == store.object_path(BIG_SHA)
+    assert store.referenced_object("bob-exp", BIG_SHA, len(BIG) + 1) is None
+    assert store.referenced_object("alice-exp", BIG_SHA, len(BIG)) is None
+
+
+def test_manifest_only_counts_own_content(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(delta, "refresh_main_tree", lambda repo_name: {})
+    store_blob(store, tmp_path, "bob-exp")
+
+    def missing(repo_name, size=len(BIG)):
+        manifest = [ManifestEntry(path="big.bin", sha256=BIG_SHA, size=size)]
+        return delta.create_session(repo_name, repo_name.split("-")[0], manifest).missing
+
+    # Another user's blob is neither revealed nor handed out
+    assert missing("alice-exp") == [BIG_SHA]
+    assert missing("bob-exp") == []
+    assert missing("bob-exp", size=1) == [BIG_SHA]
+
+    session = delta.load_session(delta.create_session(
+        "alice-exp", "alice", [ManifestEntry(path="big.bin", sha256=BIG_SHA, size=len(BIG))]
+    ).session_id, "alice")
+    with pytest.raises(delta.HTTPException) as exc:
+        delta.assemble_proposal(session, tmp_path / "proposal")
+    assert exc.value.status_code == 409
+
+
+@pytest.fixture
+def cached_repo(store, tmp_path, monkeypatch) -> Path:
+    """
+    Bare "remote" with a pointer file on main, already cloned into the repo
+    cache so refreshes fetch from it.
+    """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    (tmp_path / ".gitconfig").write_text("[user]\n\tname = heda\n\temail = heda@example.com\n")
+
+    seed = tmp_path / "seed"
+    seed.mkdir()
+    git("init", "-q", "-b", "main", cwd=seed)
+    (seed / "big.bin").write_text(pointer_text(BIG_SHA, len(BIG)))
+    (seed / "notes.txt").write_text("notes\n")
+    git("add", ".", cwd=seed)
+    git("commit", "-q", "-m", "initial", cwd=seed)
+
+    bare = tmp_path / "remote.git"
+    git("clone", "-q", "--bare", str(seed), str(bare), cwd=tmp_path)
+    git("clone", "-q", str(bare), str(delta.repo_cache_dir("alice-exp")), cwd=tmp_path)
+    git("remote", "add", "origin", str(bare), cwd=seed)
+    return seed
+
+
+def main_refs(store: BlobStore, repo_name: str):
+    with store._connect() as db:
+        return sorted(db.execute(
+            "SELECT path, sha256 FROM refs WHERE repo_name = ? AND ref = 'main'", (repo_name,)
+        ))
+
+
+def test_merge_rebuilds_main_refs_from_tree(store, tmp_path, cached_repo):
+    work_tree = tmp_path / "work"
+    work_tree.mkdir()
+    (work_tree / "big.bin").write_bytes(BIG)
+    (work_tree / "old.bin").write_bytes(BIG)
+    store.put_file(work_tree / "big.bin", BIG_SHA)
+    store.sync_main("alice-exp", {"old.bin": BIG_SHA})
+
+    # PR adds big.bin; old.bin was deleted from main some other way
+    store.externalize("alice-exp", "publish/x", work_tree, {"big.bin": BIG_SHA})
+    store.attach_pr("alice-exp", "publish/x", 7)
+    delta.release_pr_blobs("alice-exp", 7, merged=True)
+    assert main_refs(store, "alice-exp") == [("big.bin", BIG_SHA)]
+
+    # A later merge replaces the pointer with inline content
+    (cached_repo / "big.bin").write_text("small now\n")
+    git("commit", "-q", "-am", "inline", cwd=cached_repo)
+    git("push", "-q", "origin", "main", cwd=cached_repo)
+    delta.release_pr_blobs("alice-exp", 8, merged=True)
+
+    assert main_refs(store, "alice-exp") == []
+    assert store.collect_garbage(grace_seconds=-1) == len(BIG)
+    assert not store.has(BIG_SHA)
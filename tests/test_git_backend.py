@@ -0,0 +1,118 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app import git_backend as backends
+
+BACKENDS = ["subprocess", "dulwich"]
+
+
+def git(*args: str, cwd: Path) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE
+    ).stdout.decode()
+
+
+@pytest.fixture(autouse=True)
+def git_identity(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    for var in ("GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"):
+        monkeypatch.setenv(var, "heda")
+    for var in ("GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"):
+        monkeypatch.setenv(var, "heda@example.com")
+    (tmp_path / ".gitconfig").write_text("[user]\n\tname = heda\n\temail = heda@example.com\n")
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    if request.param == "dulwich":
+        pytest.importorskip("dulwich")
+        return backends.DulwichGitBackend()
+    return backends.SubprocessGitBackend()
+
+
+@pytest.fixture
+def remote(tmp_path) -> Path:
+    """
+    Bare repo with one commit on main.
+    """
+    seed = tmp_path / "seed"
+    seed.mkdir()
+    git("init", "-q", "-b", "main", cwd=seed)
+    (seed / "README.md").write_text("experiment\n")
+    git("add", "README.md", cwd=seed)
+    git("commit", "-q", "-m", "initial", cwd=seed)
+
+    bare = tmp_path / "remote.git"
+    git("clone", "-q", "--bare", str(seed), str(bare), cwd=tmp_path)
+    return bare
+
+
+def test_clone_commit_push(backend, remote, tmp_path):
+    work_tree = tmp_path / "work"
+    backend.clone(str(remote), work_tree)
+
+    (work_tree / "data").mkdir()
+    (work_tree / "data" / "run.csv").write_text("a,b\n1,2\n")
+    backend.commit(work_tree, "publish/test", ["data/run.csv"], "Propose experiment")
+    backend.push(work_tree, "publish/test")
+
+    assert git("show", "publish/test:data/run.csv", cwd=remote) == "a,b\n1,2\n"
+    assert git("show", "publish/test:README.md", cwd=remote) == "experiment\n"
+    assert git("rev-parse", "publish/test~1", cwd=remote) == git("rev-parse", "main", cwd=remote)
+
+
+def test_commit_without_changes_fails(backend, remote, tmp_path):
+    work_tree = tmp_path / "work"
+    backend.clone(str(remote), work_tree)
+    (work_tree / "README.md").write_text("experiment\n")
+
+    with pytest.raises((subprocess.CalledProcessError, RuntimeError)):
+        backend.commit(work_tree, "publish/empty", ["README.md"], "Nothing new")
+
+
+def test_clone_with_reference_dissociates(backend, remote, tmp_path):
+    reference = tmp_path / "reference"
+    git("clone", "-q", str(remote), str(reference), cwd=tmp_path)
+
+    work_tree = tmp_path / "work"
+    backend.clone(str(remote), work_tree, reference=reference)
+
+    assert not (work_tree / ".git" / "objects" / "info" / "alternates").exists()
+
+    # Still complete once the reference is gone
+    subprocess.run(["rm", "-rf", str(reference)], check=True)
+    (work_tree / "new.txt").write_text("new\n")
+    backend.commit(work_tree, "publish/ref", ["new.txt"], "Propose experiment")
+    backend.push(work_tree, "publish/ref")
+    git("fsck", "--strict", cwd=remote)
+    assert git("show", "publish/ref:README.md", cwd=remote) == "experiment\n"
+
+
+def test_init_and_push_main(backend, tmp_path):
+    bare = tmp_path / "empty.git"
+    git("init", "-q", "--bare", "-b", "main", str(bare), cwd=tmp_path)
+
+    work_tree = tmp_path / "work"
+    work_tree.mkdir()
+    backend.init(work_tree, str(bare))
+    (work_tree / ".github").mkdir()
+    (work_tree / ".github" / "policy.yml").write_text("on: pull_request\n")
+    backend.commit(work_tree, "main", [".github/policy.yml"], "chore: init")
+    backend.push(work_tree, "main")
+
+    assert git("show", "main:.github/policy.yml", cwd=bare) == "on: pull_request\n"
+
+
+def test_host_credentials_come_from_git_helpers(tmp_path):
+    helper = "!f() { echo username=heda-bot; echo password=secret; }; f"
+    (tmp_path / ".gitconfig").write_text(f'[credential]\n\thelper = "{helper}"\n')
+
+    assert backends.host_credentials("https://github.com/org/repo.git") == ("heda-bot", "secret")
+
+
+def test_host_credentials_without_helper(tmp_path):
+    (tmp_path / ".gitconfig").write_text("")
+
+    assert backends.host_credentials("https://github.com/org/repo.git") is None
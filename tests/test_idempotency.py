@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from app import idempotency
+from app.cache import Cache, MemoryBackend
+from app.models import PublishResponse
+from app.resilience import DependencyUnavailable
+
+RESPONSE = PublishResponse(experiment_id="abcd1234", pr_url="https://github.com/pr/7", message="Pull request created")
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, state: str = "open"):
+        self.status_code = status_code
+        self._state = state
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"state": self._state}
+
+
+@pytest.fixture
+def github(tmp_path, monkeypatch):
+    """
+    Fresh index and cache; returns the list of GitHub calls, whose outcome
+    is set through github.outcome.
+    """
+    monkeypatch.setattr(idempotency, "PUBLISH_INDEX_DB", tmp_path / "index.json")
+    monkeypatch.setattr(idempotency, "cache", Cache(MemoryBackend()))
+
+    class GitHub(list):
+        outcome = FakeResponse(200)
+
+    calls = GitHub()
+
+    def fake_call(dependency, method, url, **kwargs):
+        calls.append(url)
+        if isinstance(calls.outcome, Exception):
+            raise calls.outcome
+        return calls.outcome
+
+    monkeypatch.setattr(idempotency, "call", fake_call)
+    idempotency.record_proposal("alice-exp", "digest", "alice", 7, RESPONSE, "key-1")
+    return calls
+
+
+def test_open_pr_hit_is_cached(github):
+    assert idempotency.find_open_proposal("alice-exp", "digest", "alice") == RESPONSE
+    assert idempotency.find_open_proposal("alice-exp", "digest", "alice", "key-1") == RESPONSE
+    assert len(github) == 1
+
+
+def test_closed_pr_is_dropped(github):
+    github.outcome = FakeResponse(200, state="closed")
+
+    assert idempotency.find_open_proposal("alice-exp", "digest", "alice") is None
+    assert idempotency.load_publish_index() == {"proposals": {}, "keys": {}}
+
+
+def test_github_outage_trusts_the_index(github):
+    github.outcome = DependencyUnavailable("github", 30)
+
+    assert idempotency.find_open_proposal("alice-exp", "digest", "alice") == RESPONSE
+    assert "alice-exp:digest" in idempotency.load_publish_index()["proposals"]
+
+
+def test_reused_idempotency_key(github):
+    with pytest.raises(idempotency.HTTPException) as exc:
+        idempotency.find_open_proposal("alice-exp", "other", "alice", "key-1")
+    assert exc.value.status_code == 422
+
+
+def test_proposal_locks_are_dropped_when_idle():
+    order = []
+
+    async def publish(name):
+        async with idempotency.proposal_lock("alice-exp", "digest"):
+            order.append(f"{name} in")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} out")
+
+    async def scenario():
+        await asyncio.gather(publish("first"), publish("retry"))
+        async with idempotency.proposal_lock("alice-exp", "other"):
+            assert list(idempotency._proposal_locks) == ["alice-exp:other"]
+
+    asyncio.run(scenario())
+    assert order == ["first in", "first out", "retry in", "retry out"]
+    assert idempotency._proposal_locks == {}
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import admission, resilience
+from app.resilience import CircuitBreaker, DependencyUnavailable, call, deadline_middleware
+
+
+class FaultyServer(ThreadingHTTPServer):
+    """
+    Local dependency with injectable faults:
+      /ok           200
+      /fail         503
+      /slow/<secs>  200 after a delay
+      /slow-once    first request stalls for 2s, later ones answer at once
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.hits = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address):
+        pass  # clients hang up on slow responses on purpose
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        with self.server.lock:
+            self.server.hits[self.path] += 1
+            hits = self.server.hits[self.path]
+
+        if self.path == "/fail":
+            status = 503
+        elif self.path.startswith("/slow/"):
+            time.sleep(float(self.path.rsplit("/", 1)[1]))
+            status = 200
+        elif self.path == "/slow-once":
+            if hits == 1:
+                time.sleep(2)
+            status = 200
+        else:
+            status = 200
+
+        body = f'{{"attempt": {hits}}}'.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = FaultyServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("fake", failure_threshold=2, recovery_seconds=0.2)
+    monkeypatch.setitem(resilience.BREAKERS, "fake", breaker)
+    return breaker
+
+
+def test_breaker_opens_half_opens_and_closes(server, breaker):
+    for _ in range(2):
+        assert call("fake", "GET", f"{server.url}/fail").status_code == 503
+    assert breaker.state == "open"
+
+    # Open: rejected without reaching the dependency
+    with pytest.raises(DependencyUnavailable) as exc:
+        call("fake", "GET", f"{server.url}/fail")
+    assert exc.value.status_code == 503
+    assert exc.value.headers["Retry-After"] == "1"
+    assert server.hits["/fail"] == 2
+
+    time.sleep(0.25)
+    assert breaker.state == "half-open"
+
+    # A failed probe reopens right away
+    assert call("fake", "GET", f"{server.url}/fail").status_code == 503
+    assert breaker.state == "open"
+
+    time.sleep(0.25)
+    assert call("fake", "GET", f"{server.url}/ok").status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_a_single_probe_through(server, breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.25)
+
+    results = []
+
+    def probe(path):
+        try:
+            results.append(call("fake", "GET", f"{server.url}{path}").status_code)
+        except DependencyUnavailable:
+            results.append("rejected")
+
+    slow = threading.Thread(target=probe, args=("/slow/0.3",))
+    slow.start()
+    time.sleep(0.1)
+    probe("/ok")
+    slow.join()
+
+    assert results == ["rejected", 200]
+    assert breaker.state == "closed"
+
+
+def test_hedge_wins_over_slow_first_attempt(server, breaker, monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_DELAY_SECONDS", 0.05)
+
+    started = time.monotonic()
+    response = call("fake", "GET", f"{server.url}/slow-once", timeout=5, hedge=True)
+
+    assert time.monotonic() - started < 1
+    assert response.json() == {"attempt": 2}
+    assert breaker.state == "closed"
+
+
+def test_deadline_produces_504(server, breaker):
+    app = FastAPI()
+    app.middleware("http")(deadline_middleware)
+
+    @app.get("/proxy")
+    def proxy():
+        return call("fake", "GET", f"{server.url}/slow/1", timeout=10).json()
+
+    client = TestClient(app)
+    started = time.monotonic()
+    response = client.get("/proxy", headers={"X-Request-Timeout": "0.2"})
+
+    assert response.status_code == 504
+    assert time.monotonic() - started < 1
+    # The client's short budget must not count against the dependency
+    assert breaker.state == "closed"
+    assert breaker._failures == 0
+
+
+def test_expired_deadline_skips_the_call(server, breaker):
+    token = resilience._deadline.set(time.monotonic() - 1)
+    try:
+        with pytest.raises(resilience.DeadlineExceeded) as exc:
+            call("fake", "GET", f"{server.url}/ok")
+    finally:
+        resilience._deadline.reset(token)
+
+    assert exc.value.status_code == 504
+    assert server.hits["/ok"] == 0
+
+
+def test_no_deadline_without_header(server, breaker):
+    app = FastAPI()
+    app.middleware("http")(deadline_middleware)
+
+    @app.get("/proxy")
+    def proxy():
+        return {"remaining": resilience.remaining_time(), **call("fake", "GET", f"{server.url}/ok").json()}
+
+    response = TestClient(app).get("/proxy")
+
+    assert response.status_code == 200
+    assert response.json()["remaining"] is None
+
+
+def test_slow_publish_outlives_client_deadline(server, breaker, monkeypatch):
+    # Clone, write, commit and push take longer than the client's budget; the
+    # token exchange that follows must still go through
+    monkeypatch.setattr(admission, "get_current_user", lambda authorization: {"nickname": "alice"})
+
+    app = FastAPI()
+    app.middleware("http")(admission.admission_middleware)
+    app.middleware("http")(deadline_middleware)
+
+    @app.post("/publish")
+    def publish():
+        time.sleep(0.3)
+        return call("fake", "GET", f"{server.url}/slow/0.1", timeout=5).json()
+
+    response = TestClient(app).post("/publish", headers={"X-Request-Timeout": "0.2"})
+
+    assert response.status_code == 200
+    assert server.hits["/slow/0.1"] == 1
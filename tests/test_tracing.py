@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import tracing
+from app.tracing import span, traced, tracing_middleware
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@traced("work.sync")
+def sync_stage():
+    return "done"
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    app.middleware("http")(tracing_middleware)
+
+    @app.get("/pipeline")
+    async def pipeline():
+        with span("clone"):
+            pass
+        return {"result": sync_stage()}
+
+    return TestClient(app)
+
+
+def test_server_timing_header():
+    response = make_client().get("/pipeline")
+
+    assert response.status_code == 200
+    entries = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert entries == ["clone", "work.sync", "total"]
+    assert "dur=" in response.headers["Server-Timing"]
+
+
+def test_json_log_record(caplog):
+    caplog.set_level(logging.INFO, logger="heda.trace")
+    make_client().get("/pipeline")
+
+    (record,) = [r for r in caplog.records if r.name == "heda.trace"]
+    trace = json.loads(record.getMessage())
+    assert trace["event"] == "request_trace"
+    assert (trace["method"], trace["path"], trace["status"]) == ("GET", "/pipeline", 200)
+    assert [s["name"] for s in trace["spans"]] == ["request", "clone", "work.sync"]
+    assert all(s["error"] is None and s["dur_ms"] >= 0 for s in trace["spans"])
+
+
+def test_spans_are_noops_outside_traced_requests():
+    assert span("anything") is tracing._NOOP_SPAN
+    assert sync_stage() == "done"
+
+
+def test_trace_lines_reach_stderr_when_enabled():
+    # A plain interpreter has no logging configured; the line must still show
+    script = "from app.tracing import logger; logger.info('{\"event\": \"request_trace\"}')"
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        env={**os.environ, "HEDA_TRACING": "1"},
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    assert json.loads(result.stderr.decode()) == {"event": "request_trace"}
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import statistics
+import time
+
+import pytest
+
+from app import webhooks
+from app.utils import verify_signature
+
+SECRET = "test-webhook-secret"
+
+
+def sign(body: bytes) -> str:
+    return "sha256=" + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+def delivery(action: str, **fields) -> bytes:
+    # GitHub puts "action" first; repository/sender make up most of the size
+    payload = {"action": action, **fields}
+    payload.setdefault("repository", {
+        "name": "alice-exp",
+        "owner": {"login": "heda-test"},
+        **{f"{name}_url": f"https://api.github.com/repos/heda-test/alice-exp/{name}" for name in range(200)},
+    })
+    payload.setdefault("sender", {"login": "alice", "id": 1})
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+CHECK_RUN_SUCCESS = delivery(
+    "completed",
+    check_run={"name": "verify", "conclusion": "success", "head_sha": "abc"},
+    installation={"id": 7},
+)
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """
+    Records every body that gets JSON-decoded.
+    """
+    calls = []
+    parse = webhooks._parse
+
+    def counting_parse(body):
+        calls.append(body)
+        return parse(body)
+
+    monkeypatch.setattr(webhooks, "_parse", counting_parse)
+    return calls
+
+
+@pytest.fixture
+def merges(monkeypatch):
+    calls = []
+    monkeypatch.setattr(webhooks, "try_merge_pr", calls.append)
+    return calls
+
+
+def dispatch(event, body) -> int:
+    return asyncio.run(webhooks.dispatch_webhook(event, body))
+
+
+def test_unknown_event_is_acked_without_decoding(parsed, merges):
+    assert dispatch("push", delivery("created")) == 0
+    assert dispatch(None, b"not even json") == 0
+    assert parsed == []
+
+
+def test_wrong_action_is_acked_without_decoding(parsed, merges):
+    body = CHECK_RUN_SUCCESS.replace(b'"completed"', b'"created"', 1)
+    assert dispatch("check_run", body) == 0
+    assert parsed == []
+    assert merges == []
+
+
+def test_check_run_without_markers_is_acked_without_decoding(parsed, merges):
+    body = CHECK_RUN_SUCCESS.replace(b'"success"', b'"failure"')
+    assert dispatch("check_run", body) == 0
+    assert parsed == []
+
+
+def test_check_run_verify_success_merges(parsed, merges):
+    assert dispatch("check_run", CHECK_RUN_SUCCESS) == 1
+    assert len(parsed) == 1
+    assert merges[0]["check_run"]["head_sha"] == "abc"
+
+
+def test_check_run_of_other_check_does_not_merge(merges):
+    # Markers present elsewhere in the payload, but not on the check run
+    body = delivery(
+        "completed",
+        check_run={"name": "lint", "conclusion": "success", "output": {"title": "verify"}},
+    )
+    assert dispatch("check_run", body) == 1
+    assert merges == []
+
+
+def test_action_is_checked_after_decoding_when_not_first(merges):
+    body = json.dumps({
+        "check_run": {"name": "verify", "conclusion": "success"},
+        "action": "rerequested",
+    }).encode()
+    assert dispatch("check_run", body) == 0
+    assert merges == []
+
+
+def test_pull_request_closed_forgets_pr(monkeypatch):
+    forgotten = []
+    monkeypatch.setattr(webhooks, "forget_pr", lambda repo, number: forgotten.append((repo, number)))
+    monkeypatch.setattr(webhooks, "blob_store", None)
+
+    body = delivery("closed", pull_request={"number": 12, "merged": False})
+    assert dispatch("pull_request", body) == 1
+    assert forgotten == [("alice-exp", 12)]
+
+
+def test_member_added_invalidates_membership(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(webhooks.cache, "delete", lambda ns, key: deleted.append((ns, key)))
+
+    body = delivery("member_added", membership={"user": {"login": "bob"}})
+    assert dispatch("organization", body) == 1
+    assert deleted == [("org_members", "heda-test"), ("membership", "bob")]
+
+
+def _ack_latency(event: str, body: bytes, rounds: int = 300) -> float:
+    """
+    Median seconds to verify and dispatch one delivery, as the route does.
+    """
+    signature = sign(body)
+    loop = asyncio.new_event_loop()
+    samples = []
+    try:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            verify_signature(body, signature)
+            loop.run_until_complete(webhooks.dispatch_webhook(event, body))
+            samples.append(time.perf_counter() - started)
+    finally:
+        loop.close()
+    return statistics.median(samples)
+
+
+def test_ack_latency_benchmark(merges, capsys):
+    irrelevant = _ack_latency("check_run", CHECK_RUN_SUCCESS.replace(b'"completed"', b'"created"', 1))
+    unknown = _ack_latency("push", delivery("created"))
+    relevant = _ack_latency("check_run", CHECK_RUN_SUCCESS)
+
+    with capsys.disabled():
+        print(
+            f"\nwebhook ack p50 ({len(CHECK_RUN_SUCCESS)} byte body): "
+            f"unknown event {unknown * 1e6:.0f}us, "
+            f"irrelevant action {irrelevant * 1e6:.0f}us, "
+            f"check_run dispatch {relevant * 1e6:.0f}us"
+        )
+
+    # Irrelevant deliveries skip decoding and the handler thread hop
+    assert irrelevant < relevant
+    assert unknown < relevant